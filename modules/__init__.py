@@ -1,9 +1,20 @@
 from .pushshift_api import PushshiftAPI
 from .reddit_api import RedditAPI
+from .async_api import AsyncRedditAPI, AsyncPushshiftAPI
 from .datacontext import DataContext
-from .containers import RedditPost
+from .sqliteprofile import SQLiteProfile
+from .ratelimit import RateLimiter
+from .cache import ResponseCache
+from .containers import RedditPost, PostRecord, PostBatch, Rollup, ScoreTrajectories
+from .metrics import MetricsSink, InMemorySink, LogSink, PrometheusFileSink, set_sink, get_sink
 
 from .lockdown_start import load_national_lockdown_list
+from .aggregates import hour_of_day, hourly_metrics, hourly_metrics_from_rollup
+from .timeseries import day_offsets, threshold_histograms, threshold_histograms_from_rollup
+from .columnar import load_columnar
+from .columnstore import ColumnStore
 
 from .plotters import *
 from .utilities import *
+from .scheduler import CrawlScheduler
+from .analysis import run_analysis
@@ -0,0 +1,127 @@
+import numpy as np
+
+
+def hour_of_day(timestamps):
+    """
+    Hour of day (0-23) of unix timestamps.
+
+    timestamps, array: unix times
+
+    Returns: numpy.ndarray of ints
+    """
+    return (np.asarray(timestamps, dtype=np.int64) // 3600) % 24
+
+
+def hourly_metrics(timestamps, ups, num_comments, hour_timestamps=None, daterange=None,
+        success_score=100, average_method="mean"):
+    """
+    Compute post metrics as a function of time of day (1 hour bins).
+
+    timestamps, array: created_utc of the posts, used for daterange filtering
+
+    ups, array: upvotes of the posts
+
+    num_comments, array: number of comments of the posts
+
+    hour_timestamps, array: timestamps used to get the hour of day (e.g. created for local time), default: timestamps
+
+    daterange, tuple: 'from' (inclusive) and 'to' (exclusive) unix times, optional
+
+    success_score, int: upvote threshold for a post to be considered successful
+
+    average_method, str: "mean" or "median" for comments and upvotes per post
+
+    Returns: dict of 24-element arrays:
+        posts - number of posts submitted
+        comments - comments per post
+        upvotes - upvotes per post
+        success - fraction of 'successful' posts (upvotes > success_score)
+    """
+    timestamps   = np.asarray(timestamps, dtype=np.int64)
+    ups          = np.asarray(ups, dtype=np.int64)
+    num_comments = np.asarray(num_comments, dtype=np.int64)
+    hours = hour_of_day(timestamps if hour_timestamps is None else hour_timestamps)
+
+    if daterange is not None:
+        mask = (timestamps >= daterange[0]) & (timestamps < daterange[1])
+        hours, ups, num_comments = hours[mask], ups[mask], num_comments[mask]
+
+    counts = np.bincount(hours, minlength=24).astype(float)
+    successful = np.bincount(hours, weights=(ups > success_score), minlength=24)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        if average_method == "mean":
+            comments = np.bincount(hours, weights=num_comments, minlength=24) / counts
+            upvotes  = np.bincount(hours, weights=ups, minlength=24) / counts
+        elif average_method == "median":
+            comments = _grouped_median(hours, num_comments)
+            upvotes  = _grouped_median(hours, ups)
+        else:
+            raise ValueError(f"Unexpected value encountered for 'average_method' argument: {average_method}")
+
+        success = successful / counts
+
+    return {
+        "posts"    : counts,
+        "comments" : comments,
+        "upvotes"  : upvotes,
+        "success"  : success,
+    }
+
+
+def _grouped_median(hours, values):
+    """
+    Median of values in each hour of day, NaN for empty hours.
+    """
+    order = np.lexsort((values, hours))
+    hours, values = hours[order], values[order]
+    bounds = np.searchsorted(hours, np.arange(25))
+
+    medians = np.full(24, np.nan)
+    for h in range(24):
+        if bounds[h+1] > bounds[h]:
+            medians[h] = np.median(values[bounds[h] : bounds[h+1]])
+
+    return medians
+
+
+def hourly_metrics_from_rollup(rollup, daterange=None, success_score=100, average_method="mean"):
+    """
+    Same as hourly_metrics(), computed from pre-aggregated buckets (see DataContext.select_rollup()).
+
+    rollup, Rollup: post metrics in (day, hour) buckets
+
+    daterange, tuple: 'from' and 'to' unix times, applied to bucket start times, optional.
+                      Only for rollups selected with utc=True, hourly_metrics() filters date ranges on created_utc
+                      and local time buckets do not line up with it.
+
+    success_score, int: upvote threshold, must be one of rollup.thresholds
+
+    average_method, str: only "mean" can be computed from a rollup
+
+    Returns: dict of 24-element arrays, see hourly_metrics()
+    """
+    if average_method != "mean":
+        raise ValueError(f"Only 'mean' average_method can be computed from a rollup, got '{average_method}'.")
+    if success_score not in rollup.thresholds:
+        raise ValueError(f"success_score must be one of {rollup.thresholds} to use a rollup, got {success_score}.")
+
+    if daterange is not None and not rollup.utc:
+        raise ValueError("Date ranges are applied to created_utc, use a rollup selected with utc=True.")
+
+    mask = np.ones(len(rollup), dtype=bool)
+    if daterange is not None:
+        timestamps = rollup.timestamps
+        mask = (timestamps >= daterange[0]) & (timestamps < daterange[1])
+
+    hours = rollup["hour"][mask]
+    weighted = lambda name: np.bincount(hours, weights=rollup[name][mask], minlength=24)
+
+    counts = weighted("posts")
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return {
+            "posts"    : counts,
+            "comments" : weighted("num_comments") / counts,
+            "upvotes"  : weighted("ups") / counts,
+            "success"  : weighted(f"ups_gt_{success_score}") / counts,
+        }
@@ -0,0 +1,191 @@
+import os
+import time
+import traceback
+import multiprocessing
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+
+HOURLY_METRICS = ("posts", "comments", "upvotes", "success")
+
+
+def run_analysis(subreddits, metrics=HOURLY_METRICS, path=None, output_dir="../data/report", processes=None,
+        figures=True, tables=True, main_range=(datetime(2020,4,1,0,0,0), datetime(2020,5,1,0,0,0)),
+        reference_range=(datetime(2020,1,1,0,0,0), datetime(2020,2,1,0,0,0)),
+        start=datetime(2020,1,1,0,0,0), upvote_limits=(0, 50), success_score=100, utc=False,
+        average_method="mean", use_rollups=True, progress=True):
+    """
+    Compute hourly and daily aggregates of many subreddits in parallel and write them as CSV tables and figures.
+    Every worker process opens its own read-only DataContext, figures are drawn with the Agg backend.
+
+    Output files, per subreddit:
+        {subreddit}_hourly.csv - hour of day, main_{metric} and reference_{metric} columns
+        {subreddit}_daily.csv  - day since start, date and number of posts above each of upvote_limits
+        {subreddit}_{metric}.png, {subreddit}_frequency.png - see plot_submission_time_histogram()
+                                                             and plot_submission_frequency_histogram()
+
+    subreddits, list: subreddit names
+
+    metrics, list: hourly metrics, see plot_submission_time_histogram()
+
+    path, str: path to the SQLite database, default: config.db_path
+
+    output_dir, str: directory to write the results to, created if needed
+
+    processes, int: number of worker processes, default: number of CPUs
+
+    figures, bool: write figures
+
+    tables, bool: write CSV tables
+
+    main_range, reference_range, tuple: date ranges of the hourly metrics
+
+    start, datetime: day 0 of the daily aggregates, they end today
+
+    upvote_limits, list: upvote thresholds of the daily aggregates
+
+    success_score, int: upvote threshold for a post to be considered successful
+
+    utc, bool: hours of day in UTC (True) or local time (False)
+
+    average_method, str: "mean" or "median" for comments and upvotes per post
+
+    use_rollups, bool: compute the aggregates from the rollup tables where possible (much faster than loading the posts),
+                       hourly metrics only with utc=True (date ranges apply to created_utc, see hourly_metrics_from_rollup())
+
+    progress, bool: print a line per finished subreddit
+
+    Returns: list of dicts, one per subreddit: subreddit, posts, files, seconds and error (traceback if it failed, else None)
+    """
+    unknown = [metric for metric in metrics if metric not in HOURLY_METRICS]
+    if len(unknown) > 0:
+        raise ValueError(f"Unknown metrics {unknown}, use some of {HOURLY_METRICS}.")
+
+    if path is None:
+        from .config import db_path
+        path = db_path
+    os.makedirs(output_dir, exist_ok=True)
+
+    options = dict(
+        metrics=list(metrics), path=os.path.abspath(path), output_dir=os.path.abspath(output_dir), figures=figures,
+        tables=tables, main_range=main_range, reference_range=reference_range, start=start,
+        upvote_limits=list(upvote_limits), success_score=success_score, utc=utc,
+        average_method=average_method, use_rollups=use_rollups,
+    )
+
+    # spawned workers do not inherit open database connections and matplotlib state
+    context = multiprocessing.get_context("spawn")
+    results = []
+    with ProcessPoolExecutor(max_workers=processes, mp_context=context, initializer=_initialize_worker) as executor:
+        futures = [executor.submit(_analyse_subreddit, subreddit_name, options) for subreddit_name in subreddits]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            if progress:
+                status = "failed" if result["error"] is not None else f"{result['posts']} posts"
+                print(f"> [{len(results)}/{len(futures)}] r/{result['subreddit']}: {status}, {result['seconds']:.1f}s", flush=True)
+
+    order = { subreddit_name: i for i, subreddit_name in enumerate(subreddits) }
+    return sorted(results, key=lambda result: order[result["subreddit"]])
+
+
+def _initialize_worker():
+    import matplotlib
+    matplotlib.use("Agg")
+
+
+def _analyse_subreddit(subreddit_name, options):
+    """
+    Worker function of run_analysis(), errors are returned instead of raised so that one subreddit does not stop the others.
+    """
+    started = time.perf_counter()
+    result = { "subreddit": subreddit_name, "posts": 0, "files": [], "seconds": 0, "error": None }
+    try:
+        _write_subreddit_report(subreddit_name, options, result)
+    except Exception:
+        result["error"] = traceback.format_exc()
+
+    result["seconds"] = time.perf_counter() - started
+    return result
+
+
+def _write_subreddit_report(subreddit_name, options, result):
+    import matplotlib.pyplot as plt
+    from .datacontext import DataContext
+    from .rollups import ROLLUP_THRESHOLDS
+    from .aggregates import hourly_metrics, hourly_metrics_from_rollup
+    from .timeseries import threshold_histograms, threshold_histograms_from_rollup
+    from .plotters import plot_submission_time_histogram, plot_submission_frequency_histogram
+
+    metrics, utc = options["metrics"], options["utc"]
+    upvote_limits, start = options["upvote_limits"], options["start"]
+    main_daterange = tuple([t.timestamp() for t in options["main_range"]])
+    reference_daterange = tuple([t.timestamp() for t in options["reference_range"]])
+    ndays = int(np.ceil((datetime.now() - start).total_seconds() / 86400))
+    bins = np.arange(0, ndays + 1, 1)
+
+    hourly_source, daily_source, posts = None, None, None
+    with DataContext(options["path"], readonly=True) as context:
+        if options["use_rollups"]:
+            if all([limit in ROLLUP_THRESHOLDS for limit in upvote_limits]):
+                daily_source = context.select_rollup(subreddit_name, utc=True, include_removed=False)
+            if utc and options["average_method"] == "mean" and options["success_score"] in ROLLUP_THRESHOLDS:
+                hourly_source = context.select_rollup(subreddit_name, utc=True, include_removed=False)
+
+        if hourly_source is None or daily_source is None:
+            posts = context.select_columns(("created_utc", "created", "ups", "num_comments"),
+                subreddit_name=subreddit_name, include_removed=False)
+            hourly_source = hourly_source if hourly_source is not None else posts
+            daily_source = daily_source if daily_source is not None else posts
+
+    result["posts"] = len(posts["created_utc"]) if posts is not None else int(daily_source["posts"].sum())
+
+    def hourly(daterange):
+        if hourly_source is posts:
+            hour_timestamps = posts["created_utc"] if utc else posts["created"]
+            return hourly_metrics(posts["created_utc"], posts["ups"], posts["num_comments"],
+                hour_timestamps=hour_timestamps, daterange=daterange,
+                success_score=options["success_score"], average_method=options["average_method"])
+        return hourly_metrics_from_rollup(hourly_source, daterange, success_score=options["success_score"])
+
+    if daily_source is posts:
+        daily = threshold_histograms(posts["created_utc"], posts["ups"], upvote_limits, bins, start)
+    else:
+        daily = threshold_histograms_from_rollup(daily_source, upvote_limits, bins, start)
+
+    prefix = os.path.join(options["output_dir"], subreddit_name)
+    if options["tables"]:
+        main, reference = hourly(main_daterange), hourly(reference_daterange)
+        columns = [np.arange(24)]
+        header = ["hour"]
+        for metric in metrics:
+            columns += [main[metric], reference[metric]]
+            header += [f"main_{metric}", f"reference_{metric}"]
+        np.savetxt(f"{prefix}_hourly.csv", np.column_stack(columns), delimiter=",", header=",".join(header),
+            comments="", fmt="%g")
+        result["files"].append(f"{prefix}_hourly.csv")
+
+        with open(f"{prefix}_daily.csv", "w") as f:
+            f.write(",".join(["day", "date"] + [f"posts_ups_gt_{limit}" for limit in upvote_limits]) + "\n")
+            dates = [start.timestamp() + day * 86400 for day in bins[:-1]]
+            for day, date, counts in zip(bins[:-1], dates, daily.T):
+                row = [str(day), datetime.fromtimestamp(date).strftime("%Y-%m-%d")] + [str(count) for count in counts]
+                f.write(",".join(row) + "\n")
+        result["files"].append(f"{prefix}_daily.csv")
+
+    if options["figures"]:
+        for metric in metrics:
+            f, ax = plot_submission_time_histogram(f"Posts from r/{subreddit_name}", hourly_source, metric=metric,
+                main_range=options["main_range"], reference_range=options["reference_range"],
+                success_score=options["success_score"], utc=utc, average_method=options["average_method"])
+            f.savefig(f"{prefix}_{metric}.png")
+            plt.close(f)
+            result["files"].append(f"{prefix}_{metric}.png")
+
+        f, ax = plot_submission_frequency_histogram(f"Posts from r/{subreddit_name}", daily_source,
+            upvote_limits=upvote_limits, bins=np.arange(0, ndays, 7), start=start)
+        f.savefig(f"{prefix}_frequency.png")
+        plt.close(f)
+        result["files"].append(f"{prefix}_frequency.png")
@@ -0,0 +1,242 @@
+import json
+import time
+import asyncio
+
+from .reddit_api import RedditAPI
+from .pushshift_api import PushshiftAPI
+from .ratelimit import RateLimiter, retry_after
+from . import metrics
+
+
+def _create_async_session(pool_size=100):
+    """
+    Create an aiohttp.ClientSession with a connection pool (requires aiohttp).
+
+    pool_size, int: maximum number of open connections
+    """
+    import aiohttp
+
+    connector = aiohttp.TCPConnector(limit=pool_size)
+    return aiohttp.ClientSession(connector=connector, headers={ "Accept-Encoding": "gzip, deflate" })
+
+
+async def _async_request(client, method, url, params=None, auth=None, endpoint=None, **kwargs):
+    """
+    Send a request through client's rate limiter and session.
+
+    endpoint, str: endpoint name for the response cache (see ResponseCache.ttls) and metrics, not cached if None
+
+    Returns: response body, bytes
+    """
+    name = endpoint if endpoint is not None else "access_token"
+    cached = endpoint is not None and client.cache is not None
+    if cached:
+        content = client.cache.get(endpoint, url, params)
+        if content is not None:
+            metrics.increment("api_cache_hits_total", endpoint=name)
+            return content
+
+    wait = client.ratelimiter.reserve()
+    metrics.observe("ratelimit_wait_seconds", max(wait, 0), endpoint=name)
+    await asyncio.sleep(wait)
+
+    if client.session is None:
+        client.session = _create_async_session(client.pool_size)
+
+    if params is not None:
+        # aiohttp does not skip None values like requests does
+        params = { key: value for key, value in params.items() if value is not None }
+    if auth is not None:
+        import aiohttp
+        auth = aiohttp.BasicAuth(*auth)
+
+    start = time.perf_counter()
+    try:
+        async with client.session.request(method, url, params=params, auth=auth, **kwargs) as response:
+            metrics.increment("api_requests_total", endpoint=name, status=response.status)
+            client.ratelimiter.update(response.headers)
+            if response.status == 429:
+                # hold the other tasks sharing the rate limiter too
+                client.ratelimiter.pause(retry_after(response.headers) or 1)
+            response.raise_for_status()
+            content = await response.read()
+    except Exception as e:
+        if not hasattr(e, "status"):
+            # connection errors, HTTP errors are already counted with their status
+            metrics.increment("api_requests_total", endpoint=name, status=type(e).__name__)
+        raise
+    finally:
+        metrics.observe("api_request_seconds", time.perf_counter() - start, endpoint=name)
+
+    if cached:
+        client.cache.put(endpoint, url, params, content)
+
+    return content
+
+
+class AsyncRedditAPI(RedditAPI):
+    """
+    Asyncio version of RedditAPI, new_posts(), search() and info() are coroutines.
+    Requires aiohttp.
+
+    Authentication happens on the first request, the token is refreshed once for all concurrent tasks.
+
+        async with AsyncRedditAPI() as rapi:
+            results = await asyncio.gather(*[rapi.info(subreddit, ids) for ids in id_subsets])
+
+    client_id, str: Reddit API client ID, optional
+
+    secret, str: Reddit API client secret, optional
+
+    ratelimiter, RateLimiter: request scheduler, can be shared with other clients, optional
+
+    session, aiohttp.ClientSession: HTTP transport, anything with an aiohttp-like request() will do, optional
+
+    pool_size, int: number of pooled connections if the session is not provided, default: 100
+
+    cache, ResponseCache: cache for new_posts(), search() and info() responses, optional
+
+    api_url, str: API server, default: RedditAPI.API_URL
+
+    auth_url, str: authentication server, default: RedditAPI.AUTH_URL
+    """
+    def __init__(self, client_id=None, secret=None, ratelimiter=None, session=None, pool_size=100, cache=None,
+            api_url=None, auth_url=None):
+        self._access_token = None
+        self._access_token_deadline = None
+        self._client_id = client_id
+        self._secret = secret
+        self.ratelimiter = ratelimiter if ratelimiter is not None else RateLimiter()
+        self.session = session
+        self.pool_size = pool_size
+        self.cache = cache
+        self.api_url = api_url if api_url is not None else self.API_URL
+        self.auth_url = auth_url if auth_url is not None else self.AUTH_URL
+        self._authentication_lock = None
+
+
+    async def __aenter__(self):
+        await self.verify_authentication()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+
+    async def close(self):
+        """
+        Close the pooled connections.
+        """
+        if self.session is not None:
+            await self.session.close()
+
+
+    async def authenticate(self, client_id=None, secret=None, scope="read"):
+        """
+        OAuth2, see RedditAPI.authenticate()
+        """
+        url, post_data, credentials = self._token_request(client_id, secret, scope)
+        headers = self._headers()
+        # aiohttp does not let basic auth override the expired bearer token
+        headers.pop("Authorization", None)
+        content = await _async_request(self, "POST", url, auth=credentials, data=post_data, headers=headers)
+
+        self._set_access_token(json.loads(content))
+
+
+    async def verify_authentication(self):
+        if not self._token_expired():
+            return
+
+        # the lock has to be created in the running event loop
+        if self._authentication_lock is None:
+            self._authentication_lock = asyncio.Lock()
+
+        async with self._authentication_lock:
+            # another task might have refreshed the token while this one was waiting
+            if self._token_expired():
+                await self.authenticate()
+
+
+    async def new_posts(self, subreddit, limit=100, before=None, after=None, count=None):
+        """
+        Returns posts sorted by new, see RedditAPI.new_posts()
+        """
+        await self.verify_authentication()
+        base_url, params = self._new_posts_request(subreddit, limit, before, after, count)
+        content = await _async_request(self, "GET", base_url, endpoint="new", params=params, headers=self._headers())
+
+        return self._parse_listing(content)
+
+
+    async def search(self, subreddit, query, limit=100, before=None, after=None, count=None):
+        """
+        Search API client, see RedditAPI.search()
+        """
+        await self.verify_authentication()
+        base_url, params = self._search_request(subreddit, query, limit, before, after, count)
+        content = await _async_request(self, "GET", base_url, endpoint="search", params=params, headers=self._headers())
+
+        posts, _, _ = self._parse_listing(content)
+        return posts, before, after
+
+
+    async def info(self, subreddit, item, url=None):
+        """
+        Retrieve info on a post/comment/subreddit, see RedditAPI.info()
+        """
+        await self.verify_authentication()
+        base_url, params = self._info_request(subreddit, item, url)
+        content = await _async_request(self, "GET", base_url, endpoint="info", params=params, headers=self._headers())
+
+        posts, _, _ = self._parse_listing(content)
+        return posts
+
+
+class AsyncPushshiftAPI(PushshiftAPI):
+    """
+    Asyncio version of PushshiftAPI, search() is a coroutine.
+    Requires aiohttp.
+
+    ratelimiter, RateLimiter: request scheduler, can be shared with other clients, optional
+
+    session, aiohttp.ClientSession: HTTP transport, anything with an aiohttp-like request() will do, optional
+
+    pool_size, int: number of pooled connections if the session is not provided, default: 100
+
+    cache, ResponseCache: cache for search() responses, optional
+
+    api_url, str: API server, default: PushshiftAPI.API_URL
+    """
+    def __init__(self, ratelimiter=None, session=None, pool_size=100, cache=None, api_url=None):
+        self._header = { "User-Agent": "python:reddy:v0.1 (by /u/timberhilly)" }
+        self.ratelimiter = ratelimiter if ratelimiter is not None else RateLimiter()
+        self.session = session
+        self.pool_size = pool_size
+        self.cache = cache
+        self.api_url = api_url if api_url is not None else self.API_URL
+
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+
+    async def close(self):
+        """
+        Close the pooled connections.
+        """
+        if self.session is not None:
+            await self.session.close()
+
+
+    async def search(self, subreddit, query=None, t=None, before=None, after=None, limit=500):
+        """
+        Search subreddit API client, see PushshiftAPI.search()
+        """
+        base_url, params = self._search_request(subreddit, query, t, before, after, limit)
+        content = await _async_request(self, "GET", base_url, endpoint="pushshift", params=params, headers=self._header)
+
+        return self._parse_search(content)
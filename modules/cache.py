@@ -0,0 +1,127 @@
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+
+class CachedResponse(object):
+    """
+    Response body served from ResponseCache, looks like a successful requests.Response.
+    """
+    status_code = 200
+
+    def __init__(self, content):
+        self.content = content
+        self.headers = {}
+
+    def raise_for_status(self):
+        pass
+
+
+class ResponseCache(object):
+    """
+    On-disk HTTP response cache with per-endpoint expiry times and size-bounded LRU eviction.
+    Responses are keyed by URL and request parameters.
+
+    path, str: path to the cache database (SQLite)
+
+    max_size, int: maximum total size of cached responses in bytes, least recently used ones are evicted first
+
+    ttls, dict: endpoint name -> time to live in seconds (None - never expires), updates DEFAULT_TTLS
+    """
+    DEFAULT_TTLS = {
+        "pushshift" : 30 * 24 * 3600, # historical post IDs do not change
+        "info"      : 3600,           # vote counts do
+        "search"    : 3600,
+        "new"       : 300,
+    }
+
+    def __init__(self, path="../data/cache.db", max_size=1024**3, ttls=None):
+        self.path = path
+        self.max_size = max_size
+        self.ttls = dict(self.DEFAULT_TTLS)
+        if ttls is not None:
+            self.ttls.update(ttls)
+
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS response ("
+            "key TEXT PRIMARY KEY, endpoint TEXT, content BLOB, size INTEGER, created REAL, accessed REAL)"
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS ix_response_accessed ON response (accessed)")
+        self._connection.commit()
+
+
+    def close(self):
+        self._connection.close()
+
+
+    def key(self, url, params=None):
+        """
+        Returns: cache key of a request, independent of the parameter order and unset (None) parameters
+        """
+        params = { key: value for key, value in (params or {}).items() if value is not None }
+        normalized = json.dumps([url, sorted(params.items())], default=str)
+
+        return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+    def get(self, endpoint, url, params=None):
+        """
+        Returns: cached response body or None if it is not cached or expired
+        """
+        key = self.key(url, params)
+        now = time.time()
+        with self._lock:
+            row = self._connection.execute("SELECT content, created FROM response WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+
+            content, created = row
+            ttl = self.ttls.get(endpoint)
+            if ttl is not None and now - created > ttl:
+                self._connection.execute("DELETE FROM response WHERE key = ?", (key,))
+                self._connection.commit()
+                return None
+
+            self._connection.execute("UPDATE response SET accessed = ? WHERE key = ?", (now, key))
+            self._connection.commit()
+
+        return content
+
+
+    def put(self, endpoint, url, params, content):
+        """
+        Store a response body, evicting least recently used responses if the cache is full.
+        """
+        key = self.key(url, params)
+        now = time.time()
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO response (key, endpoint, content, size, created, accessed) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, endpoint, content, len(content), now, now)
+            )
+            self._evict()
+            self._connection.commit()
+
+
+    def _evict(self):
+        total = self._connection.execute("SELECT COALESCE(SUM(size), 0) FROM response").fetchone()[0]
+        if total <= self.max_size:
+            return
+
+        evicted = []
+        for key, size in self._connection.execute("SELECT key, size FROM response ORDER BY accessed"):
+            if total <= self.max_size:
+                break
+            evicted.append((key,))
+            total -= size
+        self._connection.executemany("DELETE FROM response WHERE key = ?", evicted)
+
+
+    def clear(self):
+        with self._lock:
+            self._connection.execute("DELETE FROM response")
+            self._connection.commit()
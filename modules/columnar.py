@@ -0,0 +1,241 @@
+"""
+Columnar post files, one per subreddit and month: {directory}/{subreddit}/{YYYY-MM}.parquet (or .npz).
+
+Parquet (zstd-compressed) is used when pyarrow is installed, compressed NumPy .npz files otherwise.
+Columns are POST_FIELDS plus a "removed" flag. As in PostBatch, post IDs are stored as integers and
+None values of numeric fields as 0 with a {name}.null mask, which is a Parquet validity bitmap or
+a separate array in .npz files. In .npz files strings are stored as UTF-8 bytes with offsets
+({name}.offsets and {name}.data arrays, {name}.null mask if there are None values), so no pickling is needed.
+"""
+import os
+import glob
+import numpy as np
+from datetime import datetime, timezone
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+from .containers import POST_FIELDS, PostBatch
+
+COLUMNAR_FIELDS = POST_FIELDS + ("removed",)
+FORMATS = ("parquet", "npz")
+
+
+def default_format():
+    return "parquet" if pyarrow is not None else "npz"
+
+
+def month_ranges(first, last):
+    """
+    Calendar months (UTC) covering a time interval.
+
+    first, last, float: unix times
+
+    Returns: list of (label "YYYY-MM", month start, next month start) tuples, times in unix time
+    """
+    months = []
+    current = datetime.fromtimestamp(first, tz=timezone.utc).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    while current.timestamp() <= last:
+        following = current.replace(year=current.year + 1, month=1) if current.month == 12 else current.replace(month=current.month + 1)
+        months.append((current.strftime("%Y-%m"), int(current.timestamp()), int(following.timestamp())))
+        current = following
+
+    return months
+
+
+def write_columns(path, columns, format=None):
+    """
+    Write a dict of column arrays to a Parquet or .npz file.
+
+    path, str: file path without extension
+
+    columns, dict: name -> array (numeric arrays or object arrays of strings), and "{name}.null" masks of
+                   None values of numeric columns (see PostBatch)
+
+    format, str: "parquet" or "npz", default: default_format()
+
+    Returns: path of the written file
+    """
+    format = format if format is not None else default_format()
+    if format == "parquet":
+        if pyarrow is None:
+            raise ImportError("Writing Parquet files requires pyarrow, use format='npz' instead.")
+        # strings are typed explicitly, a column of only None values would be written with the null type otherwise
+        table = pyarrow.table({
+            name: pyarrow.array(values, type=pyarrow.string()) if values.dtype == object
+                else pyarrow.array(values, mask=columns.get(f"{name}.null"))
+            for name, values in columns.items() if not name.endswith(".null")
+        })
+        pyarrow.parquet.write_table(table, f"{path}.parquet", compression="zstd")
+        return f"{path}.parquet"
+    elif format == "npz":
+        arrays = {}
+        for name, values in columns.items():
+            if values.dtype == object:
+                arrays.update(_encode_strings(name, values))
+            else:
+                arrays[name] = values
+        np.savez_compressed(f"{path}.npz", **arrays)
+        return f"{path}.npz"
+    else:
+        raise ValueError(f"Unknown columnar format: {format}. Use one of {FORMATS}.")
+
+
+def read_columns(path, columns=None):
+    """
+    Read columns of a Parquet or .npz file, only the requested columns are read from disk.
+    Parquet files are memory-mapped.
+
+    path, str: file path
+
+    columns, list: column names, default: all
+
+    Returns: dict of name -> numpy.ndarray, None values of numeric columns are 0 and marked in "{name}.null" masks
+             (only present if the column has None values), string columns contain None
+    """
+    if path.endswith(".parquet"):
+        if pyarrow is None:
+            raise ImportError(f"Reading {path} requires pyarrow.")
+        table = pyarrow.parquet.read_table(path, columns=columns, memory_map=True)
+        result = {}
+        for name in table.column_names:
+            column = table.column(name)
+            numeric = pyarrow.types.is_integer(column.type) or pyarrow.types.is_floating(column.type) \
+                or pyarrow.types.is_boolean(column.type)
+            if column.null_count > 0 and numeric:
+                result[f"{name}.null"] = column.is_null().to_numpy(zero_copy_only=False)
+                column = column.fill_null(False if pyarrow.types.is_boolean(column.type) else 0)
+            result[name] = column.to_numpy(zero_copy_only=False)
+        return result
+
+    with np.load(path, allow_pickle=False) as archive:
+        names = sorted(set([name.split(".")[0] for name in archive.files]))
+        result = {}
+        for name in (columns if columns is not None else names):
+            if name in archive.files:
+                result[name] = archive[name]
+                if f"{name}.null" in archive.files:
+                    result[f"{name}.null"] = archive[f"{name}.null"]
+            else:
+                result[name] = _decode_strings(archive, name)
+
+        return result
+
+
+def column_files(directory, subreddit_name=None, daterange=None):
+    """
+    Find columnar files, optionally of one subreddit and months overlapping a date range.
+
+    daterange, tuple: 'from' and 'to' epochs in unix time, either can be None, optional
+
+    Returns: sorted list of file paths
+    """
+    subreddit = subreddit_name.lower() if subreddit_name is not None else "*"
+    paths = glob.glob(os.path.join(directory, subreddit, "*.parquet")) + glob.glob(os.path.join(directory, subreddit, "*.npz"))
+    if daterange is None:
+        return sorted(paths)
+
+    selected = []
+    for path in paths:
+        label = os.path.splitext(os.path.basename(path))[0]
+        month_start = datetime.strptime(label, "%Y-%m").replace(tzinfo=timezone.utc).timestamp()
+        _, start, end = month_ranges(month_start, month_start)[0]
+        if (daterange[0] is None or end > daterange[0]) and (daterange[1] is None or start <= daterange[1]):
+            selected.append(path)
+
+    return sorted(selected)
+
+
+def load_columnar(directory, subreddit_name=None, columns=("created_utc", "ups", "num_comments"), daterange=None,
+        utc=True, include_removed=True):
+    """
+    Load post columns from columnar files (see DataContext.export_columnar()), in the same form as
+    DataContext.select_columns() returns, so the result can be passed to the plotters directly.
+
+    directory, str: export directory
+
+    subreddit_name, str: name of the subreddit, default: all subreddits
+
+    columns, list: column names, see COLUMNAR_FIELDS
+
+    daterange, tuple: 'from' and 'to' epochs in unix time, either can be None, optional
+
+    utc, bool: filter daterange on created_utc (True) or created (False)
+
+    include_removed, bool: include removed posts
+
+    Returns: dict of column name -> numpy.ndarray
+    """
+    columns = list(columns)
+    time_column = "created_utc" if utc else "created"
+    filters = ([time_column] if daterange is not None else []) + ([] if include_removed else ["removed"])
+    needed = columns + [name for name in filters if name not in columns]
+
+    # files are split by created_utc month, local time can be up to a day off
+    file_range = daterange
+    if daterange is not None and not utc:
+        file_range = tuple([None if t is None else t + shift for t, shift in zip(daterange, (-86400, 86400))])
+
+    chunks = { name: [] for name in columns }
+    for path in column_files(directory, subreddit_name, file_range):
+        data = read_columns(path, needed)
+        mask = np.ones(len(data[needed[0]]), dtype=bool)
+        if daterange is not None:
+            if daterange[0] is not None:
+                mask &= data[time_column] >= daterange[0]
+            if daterange[1] is not None:
+                mask &= data[time_column] <= daterange[1]
+        if not include_removed:
+            mask &= ~data["removed"].astype(bool)
+
+        for name in columns:
+            chunks[name].append(data[name][mask])
+
+    return {
+        name: np.concatenate(chunks[name]) if len(chunks[name]) > 0 else np.array([], dtype=_dtype(name))
+        for name in columns
+    }
+
+
+def load_batch(path):
+    """
+    Returns: all posts of a columnar file as PostBatch
+    """
+    return PostBatch.from_columns(read_columns(path, list(POST_FIELDS)))
+
+
+def _dtype(name):
+    if name in PostBatch.INTEGER_FIELDS:
+        return np.int64
+    elif name in PostBatch.BOOLEAN_FIELDS or name == "removed":
+        return np.bool_
+    return object
+
+
+def _encode_strings(name, values):
+    null = np.array([value is None for value in values], dtype=bool)
+    encoded = [b"" if value is None else str(value).encode("utf-8") for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(value) for value in encoded])
+
+    arrays = {
+        f"{name}.offsets" : offsets,
+        f"{name}.data"    : np.frombuffer(b"".join(encoded), dtype=np.uint8),
+    }
+    if null.any():
+        arrays[f"{name}.null"] = null
+
+    return arrays
+
+
+def _decode_strings(archive, name):
+    offsets = archive[f"{name}.offsets"]
+    data = archive[f"{name}.data"].tobytes()
+    null = archive[f"{name}.null"] if f"{name}.null" in archive.files else np.zeros(len(offsets) - 1, dtype=bool)
+
+    values = np.empty(len(offsets) - 1, dtype=object)
+    values[:] = [None if null[i] else data[offsets[i]:offsets[i+1]].decode("utf-8") for i in range(len(values))]
+    return values
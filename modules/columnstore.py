@@ -0,0 +1,325 @@
+"""
+Memory-mapped post column store, maintained alongside the SQLite database (see DataContext(column_store=...)).
+
+Every column is a separate file in the store directory:
+    {field}.i64                  - int64 values, one per post, for NUMERIC_FIELDS and "row_id" (post.id in SQLite)
+    removed.u1                   - removed flag, uint8
+    {field}.offsets, {field}.blob - (start, end) byte offsets (int64 pairs) into UTF-8 encoded values, for STRING_FIELDS
+    meta.json                    - number of committed rows, last synced post.id and subreddit name -> id mapping
+
+Rows are appended in post.id order and never removed. Changed numbers are overwritten in place,
+changed strings are appended to the blob and their offsets overwritten. meta.json is replaced atomically
+after the data files are written, so readers always see complete rows. Readers map the files with np.memmap,
+processes reading the same store share the pages through the OS page cache.
+
+There can be only one writer (DataContext) at a time. Changed values of existing posts only reach the store
+through the DataContext that wrote them, so every DataContext writing to the database must be opened with the store
+(see load_posts(column_store=...) and CrawlScheduler(column_store=...)), otherwise the store has to be rebuilt.
+The store is marked stale before every database commit and fresh after the sync, DataContext rebuilds a stale store
+(e.g. after a crash between the two) when it is opened.
+"""
+import os
+import json
+import numpy as np
+from sqlalchemy import text
+
+NUMERIC_FIELDS = ("created_utc", "created", "ups", "downs", "num_comments", "total_awards_received", "subreddit_id")
+STRING_FIELDS = ("post_id", "author", "title")
+
+_ROWS = text(
+    "SELECT id, removed, post_id, author, title, "
+    + ", ".join([f"COALESCE({name}, 0)" for name in NUMERIC_FIELDS])
+    + " FROM post WHERE id > :last_id ORDER BY id LIMIT :limit"
+)
+
+
+class ColumnStore(object):
+    """
+    Append-only memory-mapped post columns.
+
+        store = ColumnStore("../data/columns")
+        columns = store.select(["created_utc", "created", "ups", "num_comments"], subreddit_name="unitedkingdom")
+
+    directory, str: store directory, created if needed
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.refresh()
+
+
+    def refresh(self):
+        """
+        Re-read the number of committed rows, e.g. after another process synced the store.
+        """
+        path = os.path.join(self.directory, "meta.json")
+        if os.path.exists(path):
+            with open(path) as f:
+                self.meta = json.load(f)
+        else:
+            self.meta = { "rows": 0, "last_id": 0, "subreddits": {}, "stale": False }
+
+        self._maps = {}
+
+
+    def __len__(self):
+        return self.meta["rows"]
+
+
+    @property
+    def stale(self):
+        """
+        True if the database was committed without syncing the store afterwards.
+        """
+        return self.meta.get("stale", False)
+
+
+    def mark_stale(self):
+        """
+        Mark the store as out of date until the next sync(), called before committing the database.
+        """
+        if not self.stale:
+            self.meta["stale"] = True
+            self._write_meta()
+
+
+    def __getitem__(self, name):
+        """
+        Returns: read-only np.memmap of a numeric column ("removed" and "row_id" too), decoded object array of a string column
+        """
+        if name in STRING_FIELDS:
+            return self.strings(name)
+
+        return self._map(name)
+
+
+    def _path(self, name, extension=None):
+        if extension is None:
+            extension = "u1" if name == "removed" else "i64"
+        return os.path.join(self.directory, f"{name}.{extension}")
+
+
+    def _map(self, name, mode="r", shape=None):
+        if mode == "r" and name in self._maps:
+            return self._maps[name]
+
+        dtype = np.uint8 if name == "removed" else np.int64
+        if shape is None:
+            shape = (len(self), 2) if name.endswith(".offsets") else (len(self),)
+        if shape[0] == 0:
+            array = np.zeros(shape, dtype=dtype)
+        else:
+            path = self._path(*name.split(".")) if "." in name else self._path(name)
+            array = np.memmap(path, dtype=dtype, mode=mode, shape=shape)
+
+        if mode == "r":
+            self._maps[name] = array
+        return array
+
+
+    def strings(self, name, rows=None):
+        """
+        Decode a string column.
+
+        rows, array: row indices or a boolean mask, default: all rows
+
+        Returns: object array of strings
+        """
+        offsets = self._map(f"{name}.offsets")
+        if rows is not None:
+            offsets = offsets[rows]
+        path = self._path(name, "blob")
+        blob = np.memmap(path, dtype=np.uint8, mode="r") if len(offsets) > 0 and os.path.getsize(path) > 0 else b""
+
+        values = np.empty(len(offsets), dtype=object)
+        values[:] = [bytes(blob[start:end]).decode("utf-8") for start, end in offsets]
+        return values
+
+
+    def select(self, columns=("created_utc", "ups", "num_comments"), subreddit_name=None, daterange=None,
+            utc=True, include_removed=True):
+        """
+        Select and filter post columns, same arguments as DataContext.select_columns().
+        Numeric columns are returned as read-only memory maps (no copy) if no filters are given.
+
+        Returns: dict of column name -> numpy.ndarray
+        """
+        mask = None
+        def restrict(condition):
+            return condition if mask is None else mask & condition
+
+        if subreddit_name is not None:
+            subreddit_id = self.meta["subreddits"].get(subreddit_name.lower(), -1)
+            mask = restrict(self._map("subreddit_id") == subreddit_id)
+        if daterange is not None:
+            timestamps = self._map("created_utc" if utc else "created")
+            if daterange[0] is not None:
+                mask = restrict(timestamps >= daterange[0])
+            if daterange[1] is not None:
+                mask = restrict(timestamps <= daterange[1])
+        if not include_removed:
+            mask = restrict(self._map("removed") == 0)
+
+        result = {}
+        for name in columns:
+            if name in STRING_FIELDS:
+                result[name] = self.strings(name, mask)
+            else:
+                result[name] = self._map(name) if mask is None else self._map(name)[mask]
+
+        return result
+
+
+    def sync(self, connection, updates=None, chunk_size=100000):
+        """
+        Append posts added to the database since the last sync and apply changes of existing posts.
+
+        connection, sqlalchemy connection/session: database to read the new posts from (committed data)
+
+        updates, dict: post.id -> dict of changed column values, see DataContext.add_posts()
+
+        chunk_size, int: number of posts read from the database at a time
+        """
+        subreddits = dict(connection.execute(text("SELECT name, id FROM subreddit")).fetchall())
+        self._truncate()
+
+        try:
+            while True:
+                rows = connection.execute(_ROWS, { "last_id": self.meta["last_id"], "limit": chunk_size }).fetchall()
+                if len(rows) == 0:
+                    break
+                columns = list(zip(*rows))
+                self._append(columns)
+                self.meta["rows"] += len(rows)
+                self.meta["last_id"] = int(columns[0][-1])
+
+            if updates:
+                self._update(updates)
+        except:
+            # the rows written so far are dropped on the next sync
+            self.refresh()
+            raise
+
+        self.meta["subreddits"] = subreddits
+        self.meta["stale"] = False
+        self._write_meta()
+
+
+    def rebuild(self, connection, chunk_size=100000):
+        """
+        Drop all rows and copy the posts from the database again, e.g. after it was written without the store.
+
+        connection, sqlalchemy connection/session: database to read the posts from (committed data)
+
+        chunk_size, int: number of posts read from the database at a time
+        """
+        # readers see an empty store until the sync is finished
+        self.meta.update({ "rows": 0, "last_id": 0, "stale": True })
+        self._write_meta()
+        for name in NUMERIC_FIELDS + ("row_id", "removed"):
+            self._remove(self._path(name))
+        for name in STRING_FIELDS:
+            self._remove(self._path(name, "offsets"))
+            self._remove(self._path(name, "blob"))
+
+        self.sync(connection, chunk_size=chunk_size)
+
+
+    def _remove(self, path):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+    def _append(self, columns):
+        row_ids, removed, strings, numbers = columns[0], columns[1], columns[2:5], columns[5:]
+
+        with open(self._path("row_id"), "ab") as f:
+            f.write(np.array(row_ids, dtype=np.int64).tobytes())
+        with open(self._path("removed"), "ab") as f:
+            f.write(np.array(removed, dtype=np.uint8).tobytes())
+        for name, values in zip(NUMERIC_FIELDS, numbers):
+            with open(self._path(name), "ab") as f:
+                f.write(np.array(values, dtype=np.int64).tobytes())
+        for name, values in zip(STRING_FIELDS, strings):
+            self._append_strings(name, values)
+
+
+    def _append_strings(self, name, values):
+        with open(self._path(name, "offsets"), "ab") as f:
+            f.write(self._append_blob(name, values).tobytes())
+
+
+    def _append_blob(self, name, values):
+        """
+        Append values to the blob of a string column.
+
+        Returns: (start, end) offsets of the values, int64 array of shape (len(values), 2)
+        """
+        path = self._path(name, "blob")
+        position = os.path.getsize(path) if os.path.exists(path) else 0
+
+        encoded = [b"" if value is None else str(value).encode("utf-8") for value in values]
+        lengths = np.array([len(value) for value in encoded], dtype=np.int64)
+        ends = position + np.cumsum(lengths)
+        with open(path, "ab") as f:
+            f.write(b"".join(encoded))
+
+        return np.column_stack([ends - lengths, ends]).astype(np.int64)
+
+
+    def _truncate(self):
+        """
+        Drop rows written after the last committed meta.json (e.g. by an interrupted sync).
+        Orphaned bytes at the end of the blobs are not referenced by any offsets and are left as they are.
+        """
+        rows = self.meta["rows"]
+        sizes = { self._path(name): rows * 8 for name in NUMERIC_FIELDS + ("row_id",) }
+        sizes[self._path("removed")] = rows
+        sizes.update({ self._path(name, "offsets"): rows * 16 for name in STRING_FIELDS })
+
+        for path, size in sizes.items():
+            if os.path.exists(path) and os.path.getsize(path) > size:
+                os.truncate(path, size)
+
+
+    def _update(self, updates):
+        """
+        Overwrite changed values of rows already in the store.
+        """
+        rows = self.meta["rows"]
+        if rows == 0:
+            return
+        row_ids = np.memmap(self._path("row_id"), dtype=np.int64, mode="r", shape=(rows,))
+        ids = np.array(list(updates.keys()), dtype=np.int64)
+        positions = np.searchsorted(row_ids, ids)
+        found = (positions < rows) & (row_ids[np.minimum(positions, rows - 1)] == ids)
+
+        fields = set([name for changes in updates.values() for name in changes])
+        for name in fields:
+            if name not in NUMERIC_FIELDS + STRING_FIELDS + ("removed",):
+                continue
+            selected = [(position, updates[int(row_id)][name]) for row_id, position, ok in zip(ids, positions, found)
+                if ok and name in updates[int(row_id)]]
+            if len(selected) == 0:
+                continue
+            indices, values = zip(*selected)
+            indices = np.array(indices)
+
+            if name in STRING_FIELDS:
+                blob_offsets = self._append_blob(name, values)
+                offsets = self._map(f"{name}.offsets", mode="r+", shape=(rows, 2))
+                offsets[indices] = blob_offsets
+                offsets.flush()
+            else:
+                column = self._map(name, mode="r+", shape=(rows,))
+                column[indices] = [0 if value is None else value for value in values]
+                column.flush()
+
+
+    def _write_meta(self):
+        path = os.path.join(self.directory, "meta.json")
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, "w") as f:
+            json.dump(self.meta, f)
+        os.replace(temporary, path)
+        self._maps = {}
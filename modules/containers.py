@@ -1,12 +1,15 @@
 import os
 import json
+import numpy as np
 from datetime import datetime
 
 
 class PushShiftPost(object):
     """
-    Reddit post retrieved from PushShift API
+    Reddit post retrieved from PushShift API, only the fields used for discovery are kept.
     """
+    __slots__ = ("subreddit", "id", "title", "permalink", "url", "created_utc")
+
     def __init__(self, data):
         """
         data: JSON returned by PushShift API, containing a single post.
@@ -14,7 +17,12 @@ class PushShiftPost(object):
         if type(data) is not dict:
             data = json.load(data)
 
-        self.data = data
+        self.subreddit   = data.get("subreddit")
+        self.id          = data["id"]
+        self.title       = data.get("title")
+        self.permalink   = data.get("permalink")
+        self.url         = data.get("url")
+        self.created_utc = data["created_utc"]
 
 
     @classmethod
@@ -22,37 +30,307 @@ class PushShiftPost(object):
         return cls(data)
 
     @property
-    def subreddit(self):
-        return self.data["subreddit"]
-    
+    def created_utc_datetime(self):
+        return _handle_timestamp(self.created_utc)
+
+
+def _handle_timestamp(value):
+    if isinstance(value, datetime):
+        return value
+    elif isinstance(value, (int, float, np.integer, np.floating)):
+        return datetime.fromtimestamp(value)
+    else:
+        raise ValueError(f"Invalid time format/value encountered: {value}.")
+
+
+# fields stored in the database, see datacontext.Post
+POST_FIELDS = (
+    "id", "subreddit", "author", "author_premium", "subreddit_subscribers", "title", "downs", "ups",
+    "selftext", "num_comments", "total_awards_received", "view_count", "permalink", "url", "created", "created_utc",
+)
+
+
+class PostRecord(object):
+    """
+    Compact Reddit post container, holds only the fields stored in the database.
+    """
+    __slots__ = POST_FIELDS
+
+    def __init__(self, **fields):
+        """
+        fields: values of POST_FIELDS, missing fields are set to None.
+        """
+        for name in POST_FIELDS:
+            setattr(self, name, fields.get(name))
+
+
+    @classmethod
+    def from_json(cls, data):
+        """
+        data: JSON returned by Reddit API, containing a single post.
+        """
+        record = cls.__new__(cls)
+        for name in POST_FIELDS:
+            setattr(record, name, data.get(name))
+        if record.author_premium is None:
+            record.author_premium = False
+
+        return record
+
+
+    def to_dict(self):
+        return { name: getattr(self, name) for name in POST_FIELDS }
+
     @property
-    def id(self):
-        return self.data["id"]
+    def created_datetime(self):
+        return _handle_timestamp(self.created)
 
     @property
-    def title(self):
-        return self.data["title"]
-    
+    def created_utc_datetime(self):
+        return _handle_timestamp(self.created_utc)
+
+
+def _id_to_int(post_id):
+    """
+    Reddit post IDs are base 36 numbers.
+    """
+    return int(post_id, 36)
+
+
+def _int_to_id(value):
+    digits = "0123456789abcdefghijklmnopqrstuvwxyz"
+    value, result = int(value), ""
+    while True:
+        value, remainder = divmod(value, 36)
+        result = digits[remainder] + result
+        if value == 0:
+            return result
+
+
+class PostBatch(object):
+    """
+    Struct-of-arrays container for many posts.
+    Numeric fields are NumPy arrays (post IDs are stored as integers), strings are object arrays.
+    None values of numeric fields are stored as 0 and marked in a "{field}.null" boolean mask,
+    which is only present if the field has None values.
+
+    columns, dict: field name -> array, for all POST_FIELDS, and the "{field}.null" masks
+    """
+    INTEGER_FIELDS = (
+        "id", "subreddit_subscribers", "downs", "ups", "num_comments",
+        "total_awards_received", "view_count", "created", "created_utc",
+    )
+    BOOLEAN_FIELDS = ("author_premium",)
+    NULLABLE_FIELDS = INTEGER_FIELDS[1:] + BOOLEAN_FIELDS
+
+    def __init__(self, columns):
+        self.columns = columns
+
+
+    @classmethod
+    def from_posts(cls, posts):
+        """
+        posts, list: PostRecord/RedditPost objects
+        """
+        posts = list(posts)
+        columns = {}
+        for name in POST_FIELDS:
+            values = [getattr(post, name) for post in posts]
+            if name == "id":
+                values = [_id_to_int(value) for value in values]
+            columns[name] = cls._to_array(name, values)
+            if name in cls.NULLABLE_FIELDS:
+                cls._add_null_mask(columns, name, [value is None for value in values])
+
+        return cls(columns)
+
+
+    @classmethod
+    def from_columns(cls, columns):
+        """
+        columns, dict: field name -> array, post IDs can be strings or integers.
+                       None values are found in the arrays or given as "{field}.null" masks.
+        """
+        columns = dict(columns)
+        if len(columns["id"]) > 0 and isinstance(columns["id"][0], str):
+            columns["id"] = [_id_to_int(value) for value in columns["id"]]
+
+        result = {}
+        for name in POST_FIELDS:
+            values = columns[name]
+            result[name] = cls._to_array(name, values)
+            if name in cls.NULLABLE_FIELDS:
+                null = columns.get(f"{name}.null")
+                if null is None and not (isinstance(values, np.ndarray) and values.dtype != object):
+                    null = [value is None for value in values]
+                if null is not None:
+                    cls._add_null_mask(result, name, null)
+
+        return cls(result)
+
+
+    @classmethod
+    def _to_array(cls, name, values):
+        if name in cls.INTEGER_FIELDS:
+            return np.array([0 if value is None else value for value in values], dtype=np.int64)
+        elif name in cls.BOOLEAN_FIELDS:
+            return np.array([bool(value) for value in values], dtype=np.bool_)
+        else:
+            array = np.empty(len(values), dtype=object)
+            array[:] = list(values)
+            return array
+
+
+    @staticmethod
+    def _add_null_mask(columns, name, null):
+        null = np.asarray(null, dtype=np.bool_)
+        if null.any():
+            columns[f"{name}.null"] = null
+
+
+    def __len__(self):
+        return len(self.columns["id"])
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.record(i)
+
     @property
-    def permalink(self):
-        return self.data["permalink"]
-    
+    def ids(self):
+        """
+        Post IDs as strings.
+        """
+        return [_int_to_id(value) for value in self.columns["id"]]
+
+
+    def record(self, i):
+        """
+        Returns: i-th post as PostRecord
+        """
+        record = PostRecord.__new__(PostRecord)
+        for name in POST_FIELDS:
+            value = self.columns[name][i]
+            null = self.columns.get(f"{name}.null")
+            if name == "id":
+                value = _int_to_id(value)
+            elif null is not None and null[i]:
+                value = None
+            elif isinstance(value, np.generic):
+                value = value.item()
+            setattr(record, name, value)
+
+        return record
+
+
+class Rollup(object):
+    """
+    Post metrics aggregated in (day, hour of day) buckets, see DataContext.select_rollup()
+
+    columns, dict: column name -> array; day (since unix epoch), hour, posts, ups, num_comments
+                   and ups_gt_<threshold> (number of posts with upvotes above the threshold)
+
+    utc, bool: the posts were bucketed by created_utc (True) or created (False)
+    """
+    def __init__(self, columns, utc=True):
+        self.columns = columns
+        self.utc = utc
+
+    def __len__(self):
+        return len(self.columns["day"])
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
     @property
-    def url(self):
-        return self.data["url"]
+    def timestamps(self):
+        """
+        Unix time of the start of each bucket.
+        """
+        return self.columns["day"] * 86400 + self.columns["hour"] * 3600
 
     @property
-    def created_utc(self, datetime=False):
-        return self._handle_timestamp(self.data["created_utc"]) if datetime == True else self.data["created_utc"]
+    def thresholds(self):
+        """
+        Upvote thresholds with pre-computed post counts.
+        """
+        return sorted([int(name[len("ups_gt_"):]) for name in self.columns if name.startswith("ups_gt_")])
 
 
-    def _handle_timestamp(self, value):
-        if type(value) is isinstance(value, datetime):
-            return value
-        elif type(value) is float or type(value) is int:
-            return datetime.fromtimestamp(value)
-        else:
-            raise ValueError(f"Invalid time format/value encountered: {value}.")
+class ScoreTrajectories(object):
+    """
+    Score history of many posts, see DataContext.score_trajectories()
+
+    Snapshots of all posts are stored in flat arrays sorted by post and age,
+    snapshots of i-th post are offsets[i]:offsets[i+1]. A value holds until the next snapshot of the post.
+
+    columns, dict: snapshot field -> array; age (seconds since created_utc), observed_at (unix time),
+                   ups, num_comments, total_awards_received
+
+    post_ids, array: post IDs as integers, one per post
+
+    created_utc, array: post creation times, one per post
+
+    offsets, array: start of each post's snapshots in the columns, len(post_ids) + 1 elements
+    """
+    def __init__(self, columns, post_ids, created_utc, offsets):
+        self.columns = columns
+        self.post_ids = post_ids
+        self.created_utc = created_utc
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.post_ids)
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    @property
+    def ids(self):
+        """
+        Post IDs as strings.
+        """
+        return [_int_to_id(value) for value in self.post_ids]
+
+
+    def trajectory(self, i):
+        """
+        Returns: dict of snapshot field -> array for i-th post
+        """
+        start, end = self.offsets[i], self.offsets[i+1]
+        return { name: values[start:end] for name, values in self.columns.items() }
+
+
+    def at_age(self, ages, field="ups"):
+        """
+        Sample the trajectories at fixed post ages, e.g. upvotes 1, 6 and 24 hours after posting.
+
+        ages, array: post ages in seconds
+
+        field, str: snapshot field
+
+        Returns: array of shape (number of posts, number of ages), NaN where the post was not observed yet
+        """
+        ages = np.atleast_1d(np.asarray(ages, dtype=np.int64))
+        result = np.full((len(self), len(ages)), np.nan)
+        if len(self.columns["age"]) == 0:
+            return result
+
+        # (post, age) pairs as single sorted keys
+        post_index = np.repeat(np.arange(len(self)), np.diff(self.offsets))
+        span = int(self.columns["age"].max()) + 1
+        keys = post_index * span + self.columns["age"]
+
+        queries = np.arange(len(self))[:, None] * span + np.clip(ages, 0, span - 1)[None, :]
+        index = np.searchsorted(keys, queries.ravel(), side="right") - 1
+        rows = np.repeat(np.arange(len(self)), len(ages))
+        valid = (index >= 0) & (post_index[np.maximum(index, 0)] == rows) & np.tile(ages >= 0, len(self))
+
+        values = result.ravel()
+        values[valid] = self.columns[field][index[valid]]
+        return values.reshape(result.shape)
 
 
 class RedditPost(object):
@@ -1,29 +1,109 @@
 import os
 import sys
+import time
+import pathlib
 
-from sqlalchemy import create_engine, Column, ForeignKey, Integer, String, Boolean
+import numpy as np
+from sqlalchemy import create_engine, func, false, Column, ForeignKey, Index, Integer, String, Boolean, text
+from sqlalchemy import select, table, column, literal_column
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship, sessionmaker
 Base = declarative_base()
 
 from collections.abc import Iterable
-from .containers import RedditPost
+from .containers import PostRecord, PostBatch, Rollup, ScoreTrajectories, _id_to_int
+from .migrations import migrate
+from .rollups import RollupDeltas, ROLLUP_THRESHOLDS, rebuild_rollups
+from .snapshots import SNAPSHOT_FIELDS, append_snapshots
+from .sqliteprofile import SQLiteProfile
+from .columnar import month_ranges, write_columns, column_files, load_batch
+from .columnstore import ColumnStore
+from . import metrics
+
+
+# engines are shared between DataContext instances, see DataContext._get_engine()
+# settings key -> (database file identity, engine)
+_engines = {}
 
 
 class DataContext(object):
-    def __init__(self, path=None, profiler=False):
+    """
+    Database access.
+
+    path, str: path to the SQLite database, default: config.db_path
+
+    profiler, bool: log all SQL statements
+
+    profile, str/SQLiteProfile: SQLite connection settings, "default" or "performance" (WAL, larger caches), see SQLiteProfile
+
+    transaction_size, int: commit automatically after this many posts were added, optional
+
+    snapshots, bool: record score history of the added posts, see score_trajectories()
+
+    readonly, bool: open the database in read-only mode (e.g. for parallel readers), it must exist and have the current schema
+
+    column_store, str/ColumnStore: memory-mapped copy of the post columns, synced on every commit(), see columnstore.py, optional.
+                                   Every DataContext writing to the database has to use it, a stale store is rebuilt.
+    """
+    def __init__(self, path=None, profiler=False, profile=None, transaction_size=None, snapshots=True, readonly=False,
+            column_store=None):
         if path is None:
             from .config import db_path
             path = db_path
 
         self.path = path
-        self.engine = create_engine(f"sqlite:///{path}", echo=profiler)
+        self.profile = SQLiteProfile.get(profile)
+        if readonly:
+            self.profile = self.profile.readonly()
+        self.readonly = readonly
+        self.transaction_size = transaction_size
+        self.snapshots = snapshots
+        self.column_store = ColumnStore(column_store) if isinstance(column_store, str) else column_store
+        self.engine = self._get_engine(path, profiler, self.profile, readonly)
         Base.metadata.bind = self.engine
 
-        self.create_database_structure()
-
         DBSession = sessionmaker(bind=self.engine)
         self.session = DBSession()
+        self._subreddit_cache = {}
+        self._uncommitted = 0
+        self._column_store_updates = {}
+
+        if self.column_store is not None and self.column_store.stale and not readonly:
+            self.rebuild_column_store()
+
+
+    def _get_engine(self, path, profiler, profile, readonly=False):
+        """
+        Get an engine for the database, reusing one created earlier with the same settings for the same file.
+        The database structure is created/upgraded once per engine (unless it is read-only).
+        If the file was deleted or replaced since, the old engine is disposed of and a new one is created.
+        """
+        key = (os.path.abspath(path), profiler, profile.key(), readonly)
+        cached = _engines.get(key)
+        if cached is not None and cached[0] == _file_identity(path):
+            return cached[1]
+
+        # drop the engines of files that were deleted or replaced, this one included
+        for cached_key, (identity, engine) in list(_engines.items()):
+            if identity != _file_identity(cached_key[0]):
+                engine.dispose()
+                del _engines[cached_key]
+
+        if readonly:
+            if not os.path.exists(path):
+                raise FileNotFoundError(f"Database {path} does not exist, it can not be opened in read-only mode.")
+            url = f"sqlite:///{pathlib.Path(path).absolute().as_uri()}?mode=ro&uri=true"
+        else:
+            url = f"sqlite:///{path}"
+
+        engine = create_engine(url, echo=profiler, **profile.engine_arguments())
+        profile.apply(engine)
+        self.engine = engine
+        if not readonly:
+            self.create_database_structure()
+        _engines[key] = (_file_identity(path), engine)
+
+        return engine
 
     def __enter__(self):
         return self
@@ -36,20 +116,33 @@ class DataContext(object):
     
     def rollback(self):
         self.session.rollback()
+        self._subreddit_cache = {}
+        self._uncommitted = 0
+        self._column_store_updates = {}
 
 
     def create_database_structure(self):
         """
-        Create database structure if it doesn't exist.
+        Create database structure if it doesn't exist and upgrade existing databases to the current schema.
         """
         Base.metadata.create_all(self.engine)
+        migrate(self.engine)
     
 
     def commit(self):
         """
         Commit the changes to the database.
         """
-        self.session.commit()
+        if self.column_store is not None and not self.readonly:
+            self.column_store.mark_stale()
+        with metrics.timer("commit_seconds"):
+            self.session.commit()
+        self._uncommitted = 0
+
+        if self.column_store is not None and not self.readonly:
+            with metrics.timer("column_store_sync_seconds"):
+                self.column_store.sync(self.session, self._column_store_updates)
+            self._column_store_updates = {}
 
 
     def add_subreddit(self, name, raise_existing=False):
@@ -80,44 +173,548 @@ class DataContext(object):
         return entry
 
 
-    def add_posts(self, posts, update=True):
+    def add_posts(self, posts, update=True, observed_at=None):
         """
-        Add a RedditPost or a list of posts to the database. Subreddit entries are added automatically.
+        Add a post or a list of posts (PostRecord, RedditPost or a PostBatch) to the database. Subreddit entries are added automatically.
 
-        posts, array/RedditPost: single post object ot a list of post objects. Added in bulk.
+        Existing posts are resolved with a single query per batch, new posts are inserted in bulk.
+        Existing posts are only written if any of the _CHANGE_FIELDS changed (see _changed_fields()).
+
+        posts, array/PostBatch/PostRecord: single post object ot a list of post objects. Added in bulk.
 
         update, bool: update the entry if the post id already exists in the database
-        """
 
+        observed_at, int: unix time the posts were loaded at, for the score snapshots, default: now
+
+        Returns: dict with numbers of "inserted", "updated" and "unchanged" (incl. not updated) posts
+        """
+        start = time.perf_counter()
         if not isinstance(posts, Iterable):
             posts = [posts,]
-        
-        subreddit_names = set([post.subreddit for post in posts])
 
-        for subreddit_name in subreddit_names:
-            subreddit = self.add_subreddit(name=subreddit_name, raise_existing=False)
-            subreddit_posts = [post for post in posts if post.subreddit == subreddit_name]
+        # group the posts by subreddit in a single pass, the last copy of a duplicated id wins
+        grouped = {}
+        for post in posts:
+            grouped.setdefault(post.subreddit.lower(), {})[post.id] = post
+
+        existing = self._existing_posts([post_id for group in grouped.values() for post_id in group])
+        rollups = RollupDeltas()
+        counts = { "inserted": 0, "updated": 0, "unchanged": 0 }
+        snapshot_ids = []
+
+        for subreddit_name, subreddit_posts in grouped.items():
+            subreddit_id = self._subreddit_id(subreddit_name)
+
+            new_entries, updated_entries = [], []
+            for post_id, post in subreddit_posts.items():
+                row = existing.get(post_id)
+                if row is None:
+                    mapping = self._post_model_to_mapping(post)
+                    mapping["subreddit_id"] = subreddit_id
+                    new_entries.append(mapping)
+                    rollups.add(subreddit_id, mapping["created"], mapping["created_utc"],
+                        mapping["ups"], mapping["num_comments"], mapping["removed"])
+                    snapshot_ids.append(post_id)
+                    continue
+
+                changes = self._changed_fields(row, post) if update else None
+                if not changes:
+                    counts["unchanged"] += 1
+                    continue
+
+                rollups.add(subreddit_id, row.created, row.created_utc,
+                    row.ups, row.num_comments, row.removed, sign=-1)
+                rollups.add(subreddit_id, row.created, row.created_utc,
+                    changes.get("ups", row.ups), changes.get("num_comments", row.num_comments),
+                    changes.get("removed", row.removed))
+                if any([name in changes for name in SNAPSHOT_FIELDS]):
+                    snapshot_ids.append(post_id)
+                if self.column_store is not None:
+                    self._column_store_updates.setdefault(row.id, {}).update(changes)
+                changes["id"] = row.id
+                updated_entries.append(changes)
+
+            if len(new_entries) > 0:
+                self.session.bulk_insert_mappings(Post, new_entries)
+            if len(updated_entries) > 0:
+                self.session.bulk_update_mappings(Post, updated_entries)
+            counts["inserted"] += len(new_entries)
+            counts["updated"] += len(updated_entries)
+
+        rollups.apply(self.session)
+        if self.snapshots and len(snapshot_ids) > 0:
+            append_snapshots(self.session, snapshot_ids, observed_at if observed_at is not None else time.time())
+
+        metrics.increment("posts_inserted_total", counts["inserted"])
+        metrics.increment("posts_updated_total", counts["updated"])
+        metrics.increment("posts_unchanged_total", counts["unchanged"])
+        metrics.observe("add_posts_seconds", time.perf_counter() - start)
+
+        self._uncommitted += counts["inserted"] + counts["updated"]
+        if self.transaction_size is not None and self._uncommitted >= self.transaction_size:
+            self.commit()
+
+        return counts
+
+
+    def _existing_posts(self, post_ids, chunk_size=500):
+        """
+        Load stored values of existing posts for a list of post IDs, only the columns needed for change detection.
+
+        post_ids, list: post IDs to look up,
+
+        chunk_size, int: number of IDs per query (SQLite limits the number of bound parameters)
+
+        Returns: dict of post_id -> row with id, post_id, created, created_utc, removed and _CHANGE_FIELDS + _PASSIVE_FIELDS columns
+        """
+        columns = [Post.id, Post.post_id, Post.created, Post.created_utc, Post.removed] \
+            + [getattr(Post, name) for name in _CHANGE_FIELDS + _PASSIVE_FIELDS]
+
+        existing = {}
+        for i in range(0, len(post_ids), chunk_size):
+            chunk = post_ids[i : i+chunk_size]
+            for row in self.session.query(*columns).filter(Post.post_id.in_(chunk)):
+                existing[row.post_id] = row
+
+        return existing
+
+
+    def _subreddit_id(self, name):
+        """
+        Returns: database ID of the subreddit, the entry is created if needed. IDs are cached across calls.
+        """
+        name = name.lower()
+        if name not in self._subreddit_cache:
+            subreddit = self.add_subreddit(name=name, raise_existing=False)
+            if subreddit.id is None:
+                self.session.flush()
+            self._subreddit_cache[name] = subreddit.id
+
+        return self._subreddit_cache[name]
+
+
+    def add_crawl_interval(self, subreddit_name, start, end):
+        """
+        Record that all posts of a subreddit between two epochs were loaded.
+        Overlapping and adjacent intervals are merged.
+
+        subreddit_name, str: name of the subreddit,
 
-            for post in subreddit_posts:
-                existing = self.session.query(Post).filter(Post.post_id == post.id).first()
+        start, int: oldest epoch of the interval (unix time),
 
-                if existing is None:
-                    entry = self._post_model_to_entry(post)
-                    entry.subreddit = subreddit
-                    self.session.add(entry)
-                else:
-                    existing = self._update_post_entry(existing, post)
+        end, int: newest epoch of the interval (unix time)
+        """
+        start, end = int(start), int(end)
+        subreddit_id = self._subreddit_id(subreddit_name)
+
+        overlapping = self.session.query(CrawlInterval).filter(
+            CrawlInterval.subreddit_id == subreddit_id,
+            CrawlInterval.start <= end,
+            CrawlInterval.end >= start,
+        ).all()
+        for interval in overlapping:
+            start, end = min(start, interval.start), max(end, interval.end)
+            self.session.delete(interval)
+
+        entry = CrawlInterval()
+        entry.subreddit_id = subreddit_id
+        entry.start        = start
+        entry.end          = end
+        entry.updated      = int(time.time())
+        self.session.add(entry)
+
+
+    def crawl_intervals(self, subreddit_name):
+        """
+        Returns: list of (start, end) epoch intervals loaded for the subreddit, oldest first.
+        """
+        return [
+            (interval.start, interval.end)
+            for interval in self.session.query(CrawlInterval)
+                .join(Subreddit, CrawlInterval.subreddit_id == Subreddit.id)
+                .filter(Subreddit.name == subreddit_name.lower())
+                .order_by(CrawlInterval.start)
+        ]
 
 
-    def select_posts(self, subreddit_name=None, daterange=None, utc=True, include_removed=True):
+    def uncovered_ranges(self, subreddit_name, epochrange):
+        """
+        Find the parts of a date range that were not loaded yet.
+
+        subreddit_name, str: name of the subreddit,
+
+        epochrange, tuple: 'from' (newer) and 'to' (older) epochs in unix time, as in utilities.load_posts()
+
+        Returns: list of ('from', 'to') epoch ranges, newest first
+        """
+        top, bottom = epochrange
+        ranges = []
+        for start, end in reversed(self.crawl_intervals(subreddit_name)):
+            if top <= bottom:
+                break
+            if start >= top:
+                # interval is newer than the rest of the range
+                continue
+            if end < top:
+                ranges.append((top, max(end, bottom)))
+            top = start
+
+        if top > bottom:
+            ranges.append((top, bottom))
+
+        return ranges
+
+
+    def select_posts(self, subreddit_name=None, daterange=None, utc=True, include_removed=True, match=None):
         """
         Select and filter posts.
+
+        subreddit_name, str: name of the subreddit, optional
+
+        daterange, tuple: 'from' and 'to' epochs in unix time, either can be None, optional
+
+        utc, bool: filter daterange on created_utc (True) or created (False)
+
+        include_removed, bool: include removed posts
+
+        match, str: only posts with titles/selftext matching a full-text query (see search_posts()), optional
+
+        Returns: list of PostRecord objects
+        """
+        with metrics.timer("select_seconds", method="select_posts"):
+            posts = list(self.select_posts_iter(subreddit_name, daterange, utc=utc, include_removed=include_removed,
+                match=match))
+
+        metrics.increment("selected_rows_total", len(posts), method="select_posts")
+        return posts
+
+
+    def select_posts_iter(self, subreddit_name=None, daterange=None, utc=True, include_removed=True, match=None,
+            chunk_size=10000):
+        """
+        Select and filter posts, same as select_posts(), but stream them from the database in chunks.
+
+        chunk_size, int: number of rows fetched from the database at a time
+
+        Yields: PostRecord objects
         """
-        subreddit_name = subreddit_name.lower()
-        
-        query = self.session.query(Post)
+        columns = [getattr(Post, name) for name in _POST_COLUMNS] + [Subreddit.name.label("subreddit")]
+        query = self.session.query(*columns).join(Subreddit, Post.subreddit_id == Subreddit.id)
+        query = self._filter_posts(query, subreddit_name, daterange, utc, include_removed, match)
+
+        for row in query.yield_per(chunk_size):
+            yield self._post_row_to_model(row)
+
+
+    def select_columns(self, columns=("created_utc", "ups", "num_comments"), subreddit_name=None, daterange=None,
+            utc=True, include_removed=True, match=None, chunk_size=100000, nulls=False):
+        """
+        Select and filter posts, returning columns as NumPy arrays instead of post objects.
+        With a full-text match it can be used as a pre-filter for the plotters, e.g. match="lockdown".
+
+        columns, list: Post column names, e.g. "created_utc", "created", "ups", "num_comments"
+
+        chunk_size, int: number of rows fetched from the database at a time
+
+        nulls, bool: also return "{column}.null" boolean masks of the NULL values of numeric and boolean columns
+
+        Other arguments are the same as in select_posts().
+
+        Returns: dict of column name -> numpy.ndarray. NULL values of numeric columns are returned as 0.
+        """
+        start = time.perf_counter()
+        selected = []
+        for name in columns:
+            column = getattr(Post, name)
+            if isinstance(column.type, Integer):
+                column = func.coalesce(column, 0)
+            selected.append(column)
+
+        names = list(columns)
+        if nulls:
+            for name in columns:
+                column = getattr(Post, name)
+                if isinstance(column.type, (Integer, Boolean)):
+                    selected.append(column.is_(None))
+                    names.append(f"{name}.null")
+        columns = names
+
+        query = self.session.query(*selected)
+        query = self._filter_posts(query, subreddit_name, daterange, utc, include_removed, match)
+
+        chunks = { name: [] for name in columns }
+        result = self.session.execute(query.statement)
+        while True:
+            rows = result.fetchmany(chunk_size)
+            if len(rows) == 0:
+                break
+            for name, values in zip(columns, zip(*rows)):
+                chunks[name].append(np.array(values, dtype=_column_dtype(name)))
+
+        arrays = {
+            name: np.concatenate(chunks[name]) if len(chunks[name]) > 0 else np.array([], dtype=_column_dtype(name))
+            for name in columns
+        }
+
+        metrics.observe("select_seconds", time.perf_counter() - start, method="select_columns")
+        metrics.increment("selected_rows_total", sum([len(chunk) for chunk in chunks[columns[0]]]) if len(columns) > 0 else 0,
+            method="select_columns")
+        return arrays
+
+
+    def select_batch(self, subreddit_name=None, daterange=None, utc=True, include_removed=True, match=None):
+        """
+        Select and filter posts, same as select_posts(), but return them as a PostBatch.
+
+        Returns: PostBatch
+        """
+        columns = self.select_columns(_POST_COLUMNS + ["subreddit_id"], subreddit_name, daterange,
+            utc=utc, include_removed=include_removed, match=match, nulls=True)
+        columns["id"] = columns.pop("post_id")
+
+        subreddit_names = dict(self.session.query(Subreddit.id, Subreddit.name).all())
+        columns["subreddit"] = [subreddit_names.get(value) for value in columns.pop("subreddit_id")]
+        columns.pop("subreddit_id.null", None)
+
+        return PostBatch.from_columns(columns)
+
+
+    def select_rollup(self, subreddit_name, daterange=None, utc=True, include_removed=True):
+        """
+        Select pre-aggregated post metrics in (day, hour of day) buckets, much faster than loading the posts.
+
+        subreddit_name, str: name of the subreddit
+
+        daterange, tuple: 'from' and 'to' epochs in unix time (bucket resolution, i.e. 1 hour), either can be None, optional
+
+        utc, bool: bucket the posts by created_utc (True) or created (False)
+
+        include_removed, bool: include removed posts
+
+        Returns: Rollup
+        """
+        bucket_start = PostRollup.day * 86400 + PostRollup.hour * 3600
+        sums = [PostRollup.posts, PostRollup.ups, PostRollup.num_comments] \
+            + [getattr(PostRollup, f"ups_gt_{threshold}") for threshold in ROLLUP_THRESHOLDS]
+        names = ["day", "hour"] + [column.key for column in sums]
+
+        query = self.session.query(PostRollup.day, PostRollup.hour, *[func.sum(column) for column in sums]) \
+            .join(Subreddit, PostRollup.subreddit_id == Subreddit.id) \
+            .filter(Subreddit.name == subreddit_name.lower(), PostRollup.utc == bool(utc))
+        if daterange is not None:
+            if daterange[0] is not None:
+                query = query.filter(bucket_start >= daterange[0] - 3599)
+            if daterange[1] is not None:
+                query = query.filter(bucket_start <= daterange[1])
+        if not include_removed:
+            query = query.filter(PostRollup.removed == false())
+        query = query.group_by(PostRollup.day, PostRollup.hour).order_by(PostRollup.day, PostRollup.hour)
+
+        with metrics.timer("select_seconds", method="select_rollup"):
+            rows = query.all()
+        columns = {
+            name: np.array([row[i] for row in rows], dtype=np.int64)
+            for i, name in enumerate(names)
+        }
+
+        return Rollup(columns, utc=utc)
+
+
+    def search_posts(self, subreddit_name, query, daterange=None, utc=True, include_removed=True, limit=None):
+        """
+        Full-text search of stored post titles and selftext, ranked by relevance (bm25, title matches weigh more).
+        See https://www.sqlite.org/fts5.html#full_text_query_syntax, words are matched by their stem (lockdown matches lockdowns).
+
+        subreddit_name, str: name of the subreddit, None - all subreddits
+
+        query, str: FTS5 query, e.g. 'lockdown', 'lockdown OR quarantine', '"stay at home"', 'title: covid*'
+
+        limit, int: maximum number of results, optional
+
+        Other arguments are the same as in select_posts().
+
+        Returns: list of PostRecord objects, best matches first
+        """
+        self._check_full_text_index()
+        columns = [getattr(Post, name) for name in _POST_COLUMNS] + [Subreddit.name.label("subreddit")]
+        selected = self.session.query(*columns) \
+            .join(Subreddit, Post.subreddit_id == Subreddit.id) \
+            .join(_post_fts, _post_fts.c.rowid == Post.id) \
+            .filter(literal_column("post_fts").op("MATCH")(query))
+        selected = self._filter_posts(selected, subreddit_name, daterange, utc, include_removed)
+        selected = selected.order_by(literal_column("bm25(post_fts, 10.0, 1.0)"))
+        if limit is not None:
+            selected = selected.limit(limit)
+
+        with metrics.timer("select_seconds", method="search_posts"):
+            posts = [self._post_row_to_model(row) for row in selected]
+
+        metrics.increment("selected_rows_total", len(posts), method="search_posts")
+        return posts
+
+
+    def score_trajectories(self, subreddit_name=None, daterange=None, utc=True, include_removed=True, post_ids=None,
+            chunk_size=100000):
+        """
+        Select score history of posts, recorded by add_posts() (see snapshots.py).
+
+        post_ids, list: only these posts (IDs as strings), optional
+
+        chunk_size, int: number of rows fetched from the database at a time
+
+        Other arguments are the same as in select_posts(), they filter the posts.
+
+        Returns: ScoreTrajectories
+        """
+        names = ["row_id", "created_utc", "age"] + list(SNAPSHOT_FIELDS)
+        query = self.session.query(ScoreSnapshot.post_id, func.coalesce(Post.created_utc, 0), ScoreSnapshot.age,
+                *[getattr(ScoreSnapshot, name) for name in SNAPSHOT_FIELDS]) \
+            .join(Post, ScoreSnapshot.post_id == Post.id)
+        query = self._filter_posts(query, subreddit_name, daterange, utc, include_removed)
+
+        if post_ids is None:
+            queries = [query]
+        else:
+            post_ids = list(post_ids)
+            queries = [query.filter(Post.post_id.in_(post_ids[i : i+500])) for i in range(0, len(post_ids), 500)]
+
+        chunks = { name: [] for name in names }
+        for query in queries:
+            result = self.session.execute(query.order_by(ScoreSnapshot.post_id, ScoreSnapshot.age).statement)
+            while True:
+                rows = result.fetchmany(chunk_size)
+                if len(rows) == 0:
+                    break
+                for name, values in zip(names, zip(*rows)):
+                    chunks[name].append(np.array(values, dtype=np.int64))
+
+        columns = {
+            name: np.concatenate(chunks[name]) if len(chunks[name]) > 0 else np.array([], dtype=np.int64)
+            for name in names
+        }
+
+        row_ids = columns.pop("row_id")
+        starts = np.flatnonzero(np.diff(row_ids, prepend=-1) != 0)
+        created_utc = columns.pop("created_utc")
+        columns["observed_at"] = created_utc + columns["age"]
+
+        # database row IDs -> post IDs
+        post_row_ids = row_ids[starts]
+        post_ids = {}
+        for i in range(0, len(post_row_ids), 500):
+            chunk = [int(value) for value in post_row_ids[i : i+500]]
+            post_ids.update(self.session.query(Post.id, Post.post_id).filter(Post.id.in_(chunk)).all())
+
+        return ScoreTrajectories(
+            columns,
+            post_ids = np.array([_id_to_int(post_ids[value]) for value in post_row_ids], dtype=np.int64),
+            created_utc = created_utc[starts],
+            offsets = np.append(starts, len(row_ids)),
+        )
+
+
+    def export_columnar(self, directory, subreddit_name=None, format=None, include_removed=True):
+        """
+        Export posts to columnar files, one per subreddit and month (UTC), see columnar.py
+
+        directory, str: output directory, files are written to {directory}/{subreddit}/{YYYY-MM}.{format}
+
+        subreddit_name, str: name of the subreddit, default: all subreddits
+
+        format, str: "parquet" or "npz", default: Parquet if pyarrow is installed
+
+        include_removed, bool: include removed posts
+
+        Returns: list of written file paths
+        """
+        if subreddit_name is not None:
+            subreddit_names = [subreddit_name.lower()]
+        else:
+            subreddit_names = [row.name for row in self.session.query(Subreddit.name).order_by(Subreddit.name)]
+
+        paths = []
+        for name in subreddit_names:
+            query = self.session.query(func.min(Post.created_utc), func.max(Post.created_utc))
+            first, last = self._filter_posts(query, name, include_removed=include_removed).one()
+            if first is None:
+                continue
+
+            os.makedirs(os.path.join(directory, name), exist_ok=True)
+            for label, start, end in month_ranges(first, last):
+                batch = self.select_batch(name, (start, end - 1), include_removed=include_removed)
+                if len(batch) == 0:
+                    continue
+                columns = dict(batch.columns)
+                columns["removed"] = np.array([value == "[removed]" for value in columns["selftext"]], dtype=bool)
+                paths.append(write_columns(os.path.join(directory, name, label), columns, format))
+
+        return paths
+
+
+    def import_columnar(self, paths, update=True):
+        """
+        Add posts from columnar files (see export_columnar()) to the database.
+
+        paths, str/list: file path, list of file paths or an export directory
+
+        update, bool: update the entries of posts that already exist in the database
+
+        Returns: dict with numbers of "inserted", "updated" and "unchanged" posts, see add_posts()
+        """
+        if isinstance(paths, str):
+            paths = column_files(paths) if os.path.isdir(paths) else [paths]
+
+        counts = { "inserted": 0, "updated": 0, "unchanged": 0 }
+        for path in paths:
+            for name, value in self.add_posts(load_batch(path), update=update).items():
+                counts[name] += value
+            self.commit()
+
+        return counts
+
+
+    def rebuild_rollups(self):
+        """
+        Recompute the rollup tables from all posts in the database.
+        """
+        self.commit()
+        with self.engine.begin() as connection:
+            rebuild_rollups(connection)
+
+
+    def rebuild_column_store(self):
+        """
+        Copy all posts to the column store again, e.g. after the database was written by a DataContext without it.
+        """
+        # no sync on this commit, the store is copied from scratch anyway
+        self.session.commit()
+        self._uncommitted = 0
+        self._column_store_updates = {}
+        with metrics.timer("column_store_rebuild_seconds"):
+            self.column_store.rebuild(self.session)
+
+
+    def _check_full_text_index(self):
+        """
+        Raise if the post_fts table is missing (SQLite without FTS5, see migrations._003_post_full_text_index()).
+        """
+        exists = self.session.execute(text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'post_fts'")).first()
+        if exists is None:
+            raise RuntimeError("Full-text index of posts is not available, SQLite was built without the FTS5 extension. "
+                "It is created when the database is opened with an SQLite that supports FTS5.")
+
+
+    def _filter_posts(self, query, subreddit_name=None, daterange=None, utc=True, include_removed=True, match=None):
+        """
+        Apply select_posts() filters to a query on Post columns.
+        """
+        if match is not None:
+            self._check_full_text_index()
+            matching = select([_post_fts.c.rowid]).where(literal_column("post_fts").op("MATCH")(match))
+            query = query.filter(Post.id.in_(matching))
         if subreddit_name is not None:
-            query = query.filter(Post.subreddit.has(name=subreddit_name))
+            subreddit = self.session.query(Subreddit.id).filter(Subreddit.name == subreddit_name.lower()).first()
+            query = query.filter(Post.subreddit_id == subreddit.id if subreddit is not None else false())
         if daterange is not None:
             if utc:
                 if daterange[0] is not None:
@@ -130,80 +727,133 @@ class DataContext(object):
                 if daterange[1] is not None:
                     query = query.filter(Post.created <= daterange[1])
         if not include_removed:
-            query = query.filter(Post.selftext != "[removed]")
-
-        return [self._post_entry_to_model(entry) for entry in query.all()]
-
-
-    def _update_post_entry(self, target, source):
-        """
-        Updated target<Post> with values from source<Post>.
-        """
-        target.post_id         = target.post_id if source.id==source.id else source.id
-        # target.author          = target.author if source.author==source.author else source.author
-        target.author_premium  = target.author_premium if source.author_premium==source.author_premium else source.author_premium
-        target.subreddit_subscribers = target.subreddit_subscribers if source.subreddit_subscribers==source.subreddit_subscribers else source.subreddit_subscribers
-        target.title           = target.title if source.title==source.title else source.title
-        target.downs           = target.downs if source.downs==source.downs else source.downs
-        target.ups             = target.ups if source.ups==source.ups else source.ups
-        target.selftext        = target.selftext if source.selftext==source.selftext else source.selftext
-        target.num_comments    = target.num_comments if source.num_comments==source.num_comments else source.num_comments
-        target.total_awards_received = target.total_awards_received if source.total_awards_received==source.total_awards_received else source.total_awards_received
-        target.view_count      = target.view_count if source.view_count==source.view_count else source.view_count
-        # target.permalink       = target.permalink if source.permalink==source.permalink else source.permalink
-        # target.url             = target.url if source.url==source.url else source.url
-        # target.created         = target.created if source.created==source.created else source.created
-        # target.created_utc     = target.created_utc if source.created_utc==source.created_utc else source.created_utc
-
-        return target
-
-
-    def _post_model_to_entry(self, redditpost):
-        """
-        Assign values of RedditPost to Post entry.
-        """
-        entry = Post()
-        entry.post_id         = redditpost.id
-        entry.author          = redditpost.author
-        entry.author_premium  = redditpost.author_premium
-        entry.subreddit_subscribers = redditpost.subreddit_subscribers
-        entry.title           = redditpost.title
-        entry.downs           = redditpost.downs
-        entry.ups             = redditpost.ups
-        entry.selftext        = redditpost.selftext
-        entry.num_comments    = redditpost.num_comments
-        entry.total_awards_received = redditpost.total_awards_received
-        entry.view_count      = redditpost.view_count
-        entry.permalink       = redditpost.permalink
-        entry.url             = redditpost.url
-        entry.created         = redditpost.created
-        entry.created_utc     = redditpost.created_utc
+            query = query.filter(Post.removed == false())
 
-        return entry
+        return query
 
 
-    def _post_entry_to_model(self, entry):
+    def _changed_fields(self, row, post):
         """
-        Assign values of Post entry to RedditPost.
+        Compare stored values of a post with a newly loaded version.
+
+        Only _CHANGE_FIELDS are compared, _PASSIVE_FIELDS (e.g. subscriber count, which changes between any two crawls)
+        are written along if anything else changed.
+
+        row, row: stored values, see _existing_posts()
+
+        post, PostRecord/RedditPost: new version of the post
+
+        Returns: dict of column name -> new value, empty if the post did not change
         """
-        return RedditPost({
-            "id"             : entry.post_id,
-            "subreddit"      : entry.subreddit.name,
-            "author"         : entry.author,
-            "author_premium" : entry.author_premium,
-            "subreddit_subscribers" : entry.subreddit_subscribers,
-            "title"          : entry.title,
-            "downs"          : entry.downs,
-            "ups"            : entry.ups,
-            "selftext"       : entry.selftext,
-            "num_comments"   : entry.num_comments,
-            "total_awards_received" : entry.total_awards_received,
-            "view_count"     : entry.view_count,
-            "permalink"      : entry.permalink,
-            "url"            : entry.url,
-            "created"        : entry.created,
-            "created_utc"    : entry.created_utc,
-        })
+        changes = {}
+        for name in _CHANGE_FIELDS:
+            value = getattr(post, name)
+            if value != getattr(row, name):
+                changes[name] = value
+
+        if len(changes) == 0:
+            return changes
+
+        for name in _PASSIVE_FIELDS:
+            value = getattr(post, name)
+            if value != getattr(row, name):
+                changes[name] = value
+
+        removed = post.selftext == "[removed]"
+        if removed != row.removed:
+            changes["removed"] = removed
+
+        return changes
+
+
+    def _post_model_to_mapping(self, redditpost):
+        """
+        Convert a post to a dictionary of Post column values (used for bulk inserts).
+        """
+        return {
+            "post_id"        : redditpost.id,
+            "author"         : redditpost.author,
+            "author_premium" : redditpost.author_premium,
+            "subreddit_subscribers" : redditpost.subreddit_subscribers,
+            "title"          : redditpost.title,
+            "downs"          : redditpost.downs,
+            "ups"            : redditpost.ups,
+            "selftext"       : redditpost.selftext,
+            "num_comments"   : redditpost.num_comments,
+            "total_awards_received" : redditpost.total_awards_received,
+            "view_count"     : redditpost.view_count,
+            "permalink"      : redditpost.permalink,
+            "url"            : redditpost.url,
+            "created"        : redditpost.created,
+            "created_utc"    : redditpost.created_utc,
+            "removed"        : redditpost.selftext == "[removed]",
+        }
+
+
+    def _post_row_to_model(self, entry):
+        """
+        Assign values of a Post row (with joined subreddit name) to PostRecord.
+        """
+        return PostRecord(
+            id             = entry.post_id,
+            subreddit      = entry.subreddit,
+            author         = entry.author,
+            author_premium = entry.author_premium,
+            subreddit_subscribers = entry.subreddit_subscribers,
+            title          = entry.title,
+            downs          = entry.downs,
+            ups            = entry.ups,
+            selftext       = entry.selftext,
+            num_comments   = entry.num_comments,
+            total_awards_received = entry.total_awards_received,
+            view_count     = entry.view_count,
+            permalink      = entry.permalink,
+            url            = entry.url,
+            created        = entry.created,
+            created_utc    = entry.created_utc,
+        )
+
+
+# full-text index of post titles and selftext, created by migrations._003_post_full_text_index()
+_post_fts = table("post_fts", column("rowid"))
+
+
+_POST_COLUMNS = [
+    "post_id", "author", "author_premium", "subreddit_subscribers", "title", "downs", "ups", "selftext",
+    "num_comments", "total_awards_received", "view_count", "permalink", "url", "created", "created_utc",
+]
+
+# columns compared by DataContext.add_posts() to decide whether an existing post has to be updated
+_CHANGE_FIELDS = ["ups", "downs", "num_comments", "total_awards_received", "selftext", "title", "view_count"]
+
+# columns updated only together with _CHANGE_FIELDS
+_PASSIVE_FIELDS = ["author_premium", "subreddit_subscribers"]
+
+
+def _file_identity(path):
+    """
+    Returns: (device, inode) of the file, None if it does not exist
+    """
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_dev, stat.st_ino)
+
+
+def _column_dtype(name):
+    """
+    Returns: NumPy dtype for a Post column or a "{column}.null" mask.
+    """
+    if name.endswith(".null"):
+        return np.bool_
+    column_type = getattr(Post, name).type
+    if isinstance(column_type, Boolean):
+        return np.bool_
+    elif isinstance(column_type, Integer):
+        return np.int64
+    else:
+        return object
 
 
 class Subreddit(Base):
@@ -213,6 +863,69 @@ class Subreddit(Base):
     name = Column(String(250), nullable=False, unique=True)
  
  
+class CrawlInterval(Base):
+    """
+    Epoch interval [start, end] in which all posts of a subreddit were loaded.
+    """
+    __tablename__ = 'crawl_interval'
+
+    id             = Column(Integer, primary_key=True)
+
+    subreddit_id   = Column(Integer, ForeignKey('subreddit.id'), nullable=False)
+    subreddit      = relationship(Subreddit)
+
+    start          = Column(Integer, nullable=False)
+    end            = Column(Integer, nullable=False)
+    updated        = Column(Integer)
+
+    __table_args__ = (
+        Index("ix_crawl_interval_subreddit_start", "subreddit_id", "start"),
+    )
+
+
+class PostRollup(Base):
+    """
+    Post metrics aggregated in (day, hour of day) buckets, see rollups.py
+    """
+    __tablename__ = 'post_rollup'
+
+    subreddit_id   = Column(Integer, ForeignKey('subreddit.id'), primary_key=True)
+    utc            = Column(Boolean, primary_key=True)
+    removed        = Column(Boolean, primary_key=True)
+    day            = Column(Integer, primary_key=True)
+    hour           = Column(Integer, primary_key=True)
+
+    posts          = Column(Integer, nullable=False, default=0)
+    ups            = Column(Integer, nullable=False, default=0)
+    num_comments   = Column(Integer, nullable=False, default=0)
+    # keep in sync with rollups.ROLLUP_THRESHOLDS
+    ups_gt_0       = Column(Integer, nullable=False, default=0)
+    ups_gt_10      = Column(Integer, nullable=False, default=0)
+    ups_gt_50      = Column(Integer, nullable=False, default=0)
+    ups_gt_100     = Column(Integer, nullable=False, default=0)
+    ups_gt_500     = Column(Integer, nullable=False, default=0)
+    ups_gt_1000    = Column(Integer, nullable=False, default=0)
+
+
+class ScoreSnapshot(Base):
+    """
+    Post scores, a row is added when any of them changes, see snapshots.py
+    """
+    __tablename__ = 'score_snapshot'
+
+    post_id        = Column(Integer, ForeignKey('post.id'), primary_key=True)
+    age            = Column(Integer, primary_key=True) # seconds since post.created_utc
+
+    # keep in sync with snapshots.SNAPSHOT_FIELDS
+    ups            = Column(Integer, nullable=False)
+    num_comments   = Column(Integer, nullable=False)
+    total_awards_received = Column(Integer, nullable=False)
+
+    __table_args__ = (
+        { "sqlite_with_rowid": False },
+    )
+
+
 class Post(Base):
     __tablename__ = 'post'
     
@@ -235,4 +948,13 @@ class Post(Base):
     permalink      = Column(String(250))
     url            = Column(String(250))
     created        = Column(Integer)
-    created_utc    = Column(Integer)
\ No newline at end of file
+    created_utc    = Column(Integer)
+    removed        = Column(Boolean, nullable=False, default=False, server_default="0")
+
+    # keep in sync with migrations._001_post_indexes_and_removed_flag
+    __table_args__ = (
+        Index("ix_post_subreddit_created_utc", "subreddit_id", "created_utc"),
+        Index("ix_post_subreddit_created", "subreddit_id", "created"),
+        Index("ix_post_active_columns", "subreddit_id", "created_utc", "created", "ups", "num_comments",
+            sqlite_where=text("removed = 0")),
+    )
\ No newline at end of file
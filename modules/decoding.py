@@ -0,0 +1,52 @@
+"""
+Decoding of API responses straight into compact post records.
+
+orjson is used for parsing when it is installed (it is several times faster than json on large Pushshift pages),
+the standard library json module otherwise. Only the fields stored in the database are kept from each post,
+the full post dictionaries are released as soon as the page is decoded.
+"""
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from .containers import PostRecord, PushShiftPost
+
+
+def loads(content):
+    """
+    Parse JSON document.
+
+    content, bytes/str: JSON document
+    """
+    if orjson is not None:
+        return orjson.loads(content)
+
+    return json.loads(content)
+
+
+def decode_listing(content):
+    """
+    Decode Reddit API listing response.
+
+    content, bytes/str: response body
+
+    Returns: list of PostRecord objects, 'before' and 'after' IDs of the listing
+    """
+    listing = loads(content)["data"]
+    posts = [PostRecord.from_json(child["data"]) for child in listing["children"]]
+
+    return posts, listing.get("before"), listing.get("after")
+
+
+def decode_pushshift(content):
+    """
+    Decode Pushshift API search response.
+
+    content, bytes/str: response body
+
+    Returns: list of PushShiftPost objects
+    """
+    return [PushShiftPost(data) for data in loads(content)["data"]]
@@ -0,0 +1,265 @@
+import os
+import time
+import logging
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+
+
+# latency histogram bucket upper bounds, seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class MetricsSink(object):
+    """
+    Receives counter increments and histogram observations, discards them.
+    Subclass and override increment() and observe() to send them somewhere, then install with set_sink().
+
+    Metric names follow Prometheus conventions: counters end with _total, durations with _seconds.
+    Labels are keyword arguments (e.g. endpoint="info").
+    """
+    def increment(self, name, value=1, **labels):
+        pass
+
+    def observe(self, name, value, **labels):
+        pass
+
+    def flush(self):
+        pass
+
+
+class InMemorySink(MetricsSink):
+    """
+    Aggregates metrics in memory, thread-safe.
+
+        sink = set_sink(InMemorySink())
+        load_posts(...)
+        print(sink.summary())
+
+    buckets, tuple: histogram bucket upper bounds
+    """
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counters = {}
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+
+    def increment(self, name, value=1, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+
+    def observe(self, name, value, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = {
+                    "count"   : 0,
+                    "sum"     : 0.0,
+                    "max"     : 0.0,
+                    "buckets" : [0] * (len(self.buckets) + 1), # last one is +Inf
+                }
+            histogram["count"] += 1
+            histogram["sum"] += value
+            histogram["max"] = max(histogram["max"], value)
+            histogram["buckets"][bisect_left(self.buckets, value)] += 1
+
+
+    def counter(self, name, **labels):
+        """
+        Returns: counter value, summed over the labels that are not given
+        """
+        with self._lock:
+            return sum([value for (key, key_labels), value in self.counters.items()
+                if key == name and _labels_match(key_labels, labels)])
+
+
+    def histogram(self, name, **labels):
+        """
+        Returns: dict with count, sum and max of the observations, merged over the labels that are not given
+        """
+        result = { "count": 0, "sum": 0.0, "max": 0.0 }
+        with self._lock:
+            for (key, key_labels), histogram in self.histograms.items():
+                if key == name and _labels_match(key_labels, labels):
+                    result["count"] += histogram["count"]
+                    result["sum"] += histogram["sum"]
+                    result["max"] = max(result["max"], histogram["max"])
+
+        return result
+
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+
+    def summary(self):
+        """
+        Returns: human-readable table of all metrics, histograms sorted by total time
+        """
+        with self._lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted(self.histograms.items(), key=lambda item: -item[1]["sum"])
+
+        lines = []
+        for (name, labels), histogram in histograms:
+            mean = histogram["sum"] / histogram["count"]
+            lines.append(f"{_format_name(name, labels):<60} count={histogram['count']:<8} "
+                f"sum={histogram['sum']:.3f} mean={mean:.4f} max={histogram['max']:.4f}")
+        for (name, labels), value in counters:
+            lines.append(f"{_format_name(name, labels):<60} {value:g}")
+
+        return "\n".join(lines)
+
+
+    def prometheus(self):
+        """
+        Returns: metrics in Prometheus text exposition format
+        """
+        with self._lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted(self.histograms.items())
+
+        lines, typed = [], set()
+        for (name, labels), value in counters:
+            if name not in typed:
+                lines.append(f"# TYPE {name} counter")
+                typed.add(name)
+            lines.append(f"{_format_name(name, labels)} {value:g}")
+
+        for (name, labels), histogram in histograms:
+            if name not in typed:
+                lines.append(f"# TYPE {name} histogram")
+                typed.add(name)
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), histogram["buckets"]):
+                cumulative += count
+                bucket_labels = labels + (("le", str(bound)),)
+                lines.append(f"{_format_name(name + '_bucket', bucket_labels)} {cumulative}")
+            lines.append(f"{_format_name(name + '_sum', labels)} {histogram['sum']:g}")
+            lines.append(f"{_format_name(name + '_count', labels)} {histogram['count']}")
+
+        return "\n".join(lines) + "\n"
+
+
+class LogSink(MetricsSink):
+    """
+    Writes every metric as a log line, e.g. "api_request_seconds{endpoint="info"} 0.2311".
+
+    logger, logging.Logger: default: "reddy.metrics" logger
+
+    level, int: logging level, default: logging.INFO
+    """
+    def __init__(self, logger=None, level=logging.INFO):
+        self.logger = logger if logger is not None else logging.getLogger("reddy.metrics")
+        self.level = level
+
+
+    def increment(self, name, value=1, **labels):
+        self.logger.log(self.level, "%s %g", _format_name(name, _label_key(labels)), value)
+
+
+    def observe(self, name, value, **labels):
+        self.logger.log(self.level, "%s %.4f", _format_name(name, _label_key(labels)), value)
+
+
+class PrometheusFileSink(InMemorySink):
+    """
+    Aggregates metrics in memory and writes them to a file in Prometheus text format
+    (e.g. for node_exporter's textfile collector).
+    The file is replaced atomically at most every `interval` seconds and on flush().
+
+    path, str: output file path, should end with .prom for the textfile collector
+
+    interval, float: minimum time between writes in seconds
+
+    buckets, tuple: histogram bucket upper bounds
+    """
+    def __init__(self, path, interval=10, buckets=DEFAULT_BUCKETS):
+        super().__init__(buckets)
+        self.path = path
+        self.interval = interval
+        self._written = time.monotonic()
+
+
+    def increment(self, name, value=1, **labels):
+        super().increment(name, value, **labels)
+        self._maybe_flush()
+
+
+    def observe(self, name, value, **labels):
+        super().observe(name, value, **labels)
+        self._maybe_flush()
+
+
+    def _maybe_flush(self):
+        if time.monotonic() - self._written >= self.interval:
+            self.flush()
+
+
+    def flush(self):
+        self._written = time.monotonic()
+        temporary = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temporary, "w") as f:
+            f.write(self.prometheus())
+        os.replace(temporary, self.path)
+
+
+_sink = MetricsSink()
+
+
+def set_sink(sink):
+    """
+    Install a metrics sink, None disables the metrics.
+
+    Returns: the sink
+    """
+    global _sink
+    _sink = sink if sink is not None else MetricsSink()
+    return sink
+
+
+def get_sink():
+    return _sink
+
+
+def increment(name, value=1, **labels):
+    _sink.increment(name, value, **labels)
+
+
+def observe(name, value, **labels):
+    _sink.observe(name, value, **labels)
+
+
+@contextmanager
+def timer(name, **labels):
+    """
+    Observe the time spent in the with block, in seconds.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _sink.observe(name, time.perf_counter() - start, **labels)
+
+
+def _label_key(labels):
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _labels_match(key_labels, labels):
+    key_labels = dict(key_labels)
+    return all([key_labels.get(key) == str(value) for key, value in labels.items()])
+
+
+def _format_name(name, labels):
+    if len(labels) == 0:
+        return name
+
+    formatted = ",".join([f'{key}="{value}"' for key, value in labels])
+    return f"{name}{{{formatted}}}"
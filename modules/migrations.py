@@ -0,0 +1,91 @@
+"""
+Schema migrations for databases created by older versions of DataContext.
+
+New tables are created by Base.metadata.create_all(), migrations alter existing ones and create what the models can not (virtual tables, triggers).
+Each migration must be safe to run on a freshly created database as well.
+The schema version is stored in SQLite's user_version pragma.
+A migration that can not be applied yet returns False, the version stays below it and it is retried on the next run.
+"""
+import warnings
+from sqlalchemy.exc import OperationalError
+
+from .rollups import rebuild_rollups
+
+
+def _columns(connection, table):
+    return [row[1] for row in connection.execute(f"PRAGMA table_info({table})")]
+
+
+def _001_post_indexes_and_removed_flag(connection):
+    """
+    Add Post.removed flag and indexes for subreddit/date range selection.
+    """
+    if "removed" not in _columns(connection, "post"):
+        connection.execute("ALTER TABLE post ADD COLUMN removed BOOLEAN NOT NULL DEFAULT 0")
+        connection.execute("UPDATE post SET removed = 1 WHERE selftext = '[removed]'")
+
+    connection.execute("CREATE INDEX IF NOT EXISTS ix_post_subreddit_created_utc ON post (subreddit_id, created_utc)")
+    connection.execute("CREATE INDEX IF NOT EXISTS ix_post_subreddit_created ON post (subreddit_id, created)")
+    connection.execute(
+        "CREATE INDEX IF NOT EXISTS ix_post_active_columns "
+        "ON post (subreddit_id, created_utc, created, ups, num_comments) WHERE removed = 0"
+    )
+
+
+def _002_post_rollups(connection):
+    """
+    Fill the post_rollup table for existing posts.
+    """
+    rebuild_rollups(connection)
+
+
+def _003_post_full_text_index(connection):
+    """
+    Full-text index of post titles and selftext (FTS5, external content), kept in sync with the post table by triggers.
+    Deferred if SQLite was built without FTS5, DataContext.search_posts() is not available then.
+    """
+    try:
+        connection.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS post_fts USING fts5("
+            "title, selftext, content='post', content_rowid='id', tokenize='porter unicode61')"
+        )
+    except OperationalError:
+        warnings.warn("SQLite FTS5 extension is not available, full-text search of posts is disabled.")
+        return False
+
+    connection.execute(
+        "CREATE TRIGGER IF NOT EXISTS post_fts_insert AFTER INSERT ON post BEGIN "
+        "INSERT INTO post_fts (rowid, title, selftext) VALUES (new.id, new.title, new.selftext); END"
+    )
+    connection.execute(
+        "CREATE TRIGGER IF NOT EXISTS post_fts_delete AFTER DELETE ON post BEGIN "
+        "INSERT INTO post_fts (post_fts, rowid, title, selftext) VALUES ('delete', old.id, old.title, old.selftext); END"
+    )
+    connection.execute(
+        "CREATE TRIGGER IF NOT EXISTS post_fts_update AFTER UPDATE OF title, selftext ON post BEGIN "
+        "INSERT INTO post_fts (post_fts, rowid, title, selftext) VALUES ('delete', old.id, old.title, old.selftext); "
+        "INSERT INTO post_fts (rowid, title, selftext) VALUES (new.id, new.title, new.selftext); END"
+    )
+    connection.execute("INSERT INTO post_fts (post_fts) VALUES ('rebuild')")
+
+
+MIGRATIONS = [
+    _001_post_indexes_and_removed_flag,
+    _002_post_rollups,
+    _003_post_full_text_index,
+]
+
+
+def migrate(engine):
+    """
+    Apply pending migrations to the database.
+
+    engine, sqlalchemy.engine.Engine: database engine
+    """
+    with engine.begin() as connection:
+        version = connection.execute("PRAGMA user_version").scalar()
+        for i, migration in enumerate(MIGRATIONS[version:], start=version+1):
+            if migration(connection) is False:
+                # later migrations wait until this one can be applied
+                break
+            connection.execute(f"PRAGMA user_version = {i}")
@@ -1,7 +1,13 @@
+import time
 import numpy as np
 import matplotlib.pyplot as plt
 from datetime import datetime, timedelta
 from .lockdown_start import load_national_lockdown_list
+from .aggregates import hourly_metrics, hourly_metrics_from_rollup
+from .timeseries import day_offsets, threshold_histograms, threshold_histograms_from_rollup
+from .containers import PostBatch, Rollup
+from .columnstore import ColumnStore
+from . import metrics
 
 import matplotlib
 font = {
@@ -11,23 +17,87 @@ font = {
 matplotlib.rc('font', **font)
 
 
+def _post_columns(posts, names):
+    """
+    Get post attributes as column arrays.
+
+    posts, list/dict/PostBatch/ColumnStore: post objects, a dict of column arrays, a PostBatch or a ColumnStore (memory maps, not copied)
+
+    names, list: attribute names
+
+    Returns: dict of name -> numpy.ndarray
+    """
+    if isinstance(posts, (dict, PostBatch, ColumnStore)):
+        return { name: np.asarray(posts[name]) for name in names }
+
+    return { name: np.array([getattr(post, name) for post in posts]) for name in names }
+
+
+def _month_ticks(start, ndays):
+    """
+    Tick positions (days since start) and labels for the 1st and 15th of every month.
+    """
+    ticks, labels = [], []
+    year, month = start.year, start.month
+    while True:
+        for day in (1, 15):
+            t = (datetime(year, month, day) - start).total_seconds() / 86400
+            if t > ndays:
+                return ticks, labels
+            if t >= 0:
+                ticks.append(t)
+                labels.append(datetime(year, month, day).strftime("%b 1") if day == 1 else "15")
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
+
 def plot_submission_frequency_histogram_2020(title, posts, upvote_limits=[0,], figsize=(12, 8), bins=np.arange(0, 180, 7)):
+    """
+    Same as plot_submission_frequency_histogram(), starting on January 1st 2020.
+    """
+    return plot_submission_frequency_histogram(title, posts, upvote_limits=upvote_limits, figsize=figsize, bins=bins,
+        start=datetime(2020, 1, 1, 0,0,0,0))
+
+
+def plot_submission_frequency_histogram(title, posts, upvote_limits=[0,], figsize=(12, 8), bins=np.arange(0, 180, 7),
+        start=datetime(2020, 1, 1, 0,0,0,0)):
+    """
+    Plot number of submissions in time bins, relative to the first month.
+
+    posts, list/dict/PostBatch/ColumnStore/Rollup: post objects, a dict of column arrays (see DataContext.select_columns()
+                                       and ColumnStore.select()), a PostBatch, a ColumnStore (all its posts)
+                                       or a Rollup (utc=True, upvote_limits must be among its thresholds)
+
+    upvote_limits, list: plot a line for posts with upvotes above each of the limits
+
+    bins, array: bin edges in days since start
+
+    start, datetime: start date (day 0)
+    """
     colours = ["#092327", "#4F6D7A", "#9EA3B0"]
     alphas = [0.7, 0.7, 0.7]
     binsize = bins[1] - bins[0]
 
-    year_start = datetime(2020, 1, 1, 0,0,0,0)
-    getdays  = lambda t: (t-year_start).days + (t-year_start).seconds/(3600*24)
-
-    days_all = [getdays(post.created_utc_datetime) for post in posts]
+    getdays = lambda t: day_offsets(t.timestamp(), start)
+
+    if isinstance(posts, Rollup):
+        if not posts.utc:
+            raise ValueError("Use a rollup selected with utc=True for plotters.plot_submission_frequency_histogram()")
+        with metrics.timer("plot_stage_seconds", plot="frequency", stage="aggregate"):
+            counts = threshold_histograms_from_rollup(posts, upvote_limits, bins, start)
+    else:
+        with metrics.timer("plot_stage_seconds", plot="frequency", stage="columns"):
+            columns = _post_columns(posts, ["created_utc", "ups"])
+        with metrics.timer("plot_stage_seconds", plot="frequency", stage="aggregate"):
+            counts = threshold_histograms(columns["created_utc"], columns["ups"], upvote_limits, bins, start)
+
+    draw_start = time.perf_counter()
+    centres = 0.5 * (bins[1:] + bins[:-1])
     baseline = None
 
     f, ax = plt.subplots(1, 1, figsize=figsize)
     f.suptitle(title, ha="left", x=0.125, y=0.93)
     for i, ulim in enumerate(upvote_limits):
-        days_some = [getdays(post.created_utc_datetime) for post in posts if post.ups > ulim]
-        y, x = np.histogram(days_some, bins=bins)
-        x = 0.5 * (x[1:] + x[:-1])
+        x, y = centres, counts[i]
 
         if baseline is None:
             sample = y[(x >= 0) & (x <= 31)]
@@ -39,19 +109,19 @@ def plot_submission_frequency_histogram_2020(title, posts, upvote_limits=[0,], f
             x = np.insert(x, 0, bins[0]-binsize)
             y = np.insert(y, 0, 0)
         if y[-1] != 0:
-            x = np.insert(y, -1, bins[-1]+binsize)
-            y = np.insert(y, -1, 0)
+            x = np.append(x, bins[-1]+binsize)
+            y = np.append(y, 0)
 
         lw = 3 if i == 0 else 1
         ls = "-" if i == 0 else "-"
 
-        ax.step(x, y, where="mid", c=colours[i], alpha=alphas[i], lw=lw, ls=ls, label=f"upvotes > {ulim}")
+        ax.step(x, y, where="mid", c=colours[i % len(colours)], alpha=alphas[i % len(alphas)], lw=lw, ls=ls, label=f"upvotes > {ulim}")
 
-    ax.set_xticks([0, 15, 31, 46, 60, 75, 91, 106, 121, 136, 152])
-    ax.set_xticklabels(["Jan 1", "15", "Feb 1", "15", "Mar 1", "15", "Apr 1", "15", "May 1", "15", "June 1"])
+    ticks, ticklabels = _month_ticks(start, bins[-1])
+    ax.set_xticks(ticks)
+    ax.set_xticklabels(ticklabels)
 
     ax.set_ylim(0, ax.get_ylim()[1])
-    ax.set_xlim(min(days_all), max(days_all)+bins[2]-bins[0])
 
     # plot lockdown dates
     def plot_vline(ax, date, label="", color="#f17b77", yoffset=0.5, fontsize=12, alpha=1):
@@ -76,7 +146,7 @@ def plot_submission_frequency_histogram_2020(title, posts, upvote_limits=[0,], f
     #     yoffset += 2
 
     ax.set_xlabel("Date")
-    ax.set_ylabel("Number of submissions relative to January 2020")
+    ax.set_ylabel(f"Number of submissions relative to {start.strftime('%B %Y')}")
 
     ax.set_xlim(0, getdays(datetime.utcnow())-binsize)
 
@@ -85,11 +155,12 @@ def plot_submission_frequency_histogram_2020(title, posts, upvote_limits=[0,], f
     labels.append("National lockdown dates")
     ax.legend(handles, labels, frameon=False)
 
+    metrics.observe("plot_stage_seconds", time.perf_counter() - draw_start, plot="frequency", stage="draw")
     return f, ax
 
 
 def plot_submission_time_histogram(title, posts, figsize=(12, 8),
-        metric="number", 
+        metric="posts",
         main_range=(datetime(2020,4,1,0,0,0), datetime(2020,5,1,0,0,0)), 
         reference_range=(datetime(2020,1,1,0,0,0), datetime(2020,2,1,0,0,0)),
         success_score=100,
@@ -98,6 +169,11 @@ def plot_submission_time_histogram(title, posts, figsize=(12, 8),
     """
     Plot a metric as a function of time of day (1 hour bins)
 
+    posts, list/dict/PostBatch/ColumnStore/Rollup: post objects, a dict of column arrays (see DataContext.select_columns()
+                      and ColumnStore.select()), a PostBatch, a ColumnStore (all its posts)
+                      or a Rollup (selected with utc=True, only for utc=True: date ranges apply to created_utc,
+                      local time buckets do not line up with them)
+
     metric, str: Y axis metric, one of:
                  posts - number of posts submitted (default)
                  comments - number of comments in all posts
@@ -110,55 +186,46 @@ def plot_submission_time_histogram(title, posts, figsize=(12, 8),
     
     success_score, int: upvote threshold for a post to be considered successful
     """
-    if average_method == "mean":
-        average_method = np.mean
-    elif average_method == "median":
-        average_method = np.median
-
     colours = ["#A71D31", "#40434E", "#9EA3B0"]
     alphas = [1, 1, 0.7]
 
-    main_posts = [
-        post for post in posts 
-        if (post.created_utc > main_range[0].timestamp()) & 
-           (post.created_utc < main_range[1].timestamp())
-    ]
-    reference_posts = [
-        post for post in posts 
-        if (post.created_utc > reference_range[0].timestamp()) & 
-           (post.created_utc < reference_range[1].timestamp())
-    ]
-
+    ylabels = {
+        "posts"    : "Number of posts",
+        "comments" : "Comments per post",
+        "upvotes"  : "Upvotes per post",
+        "success"  : f"Percentge of posts with upvotes > {success_score}",
+    }
+    if metric not in ylabels:
+        raise ValueError("Unexpected value encountered for 'metric' argument in plotters.plot_submission_time_histogram()")
+    ylabel = ylabels[metric]
+
+    main_daterange      = (main_range[0].timestamp(), main_range[1].timestamp())
+    reference_daterange = (reference_range[0].timestamp(), reference_range[1].timestamp())
+
+    if isinstance(posts, Rollup):
+        if not posts.utc or not utc:
+            raise ValueError("Rollups can only be used with utc=True in plotters.plot_submission_time_histogram(), "
+                "use posts for local time.")
+        with metrics.timer("plot_stage_seconds", plot="time", stage="aggregate"):
+            main_y = hourly_metrics_from_rollup(posts, main_daterange,
+                success_score=success_score, average_method=average_method)[metric]
+            reference_y = hourly_metrics_from_rollup(posts, reference_daterange,
+                success_score=success_score, average_method=average_method)[metric]
+    else:
+        with metrics.timer("plot_stage_seconds", plot="time", stage="columns"):
+            columns = _post_columns(posts, ["created_utc", "created", "ups", "num_comments"])
+        hour_timestamps = columns["created_utc"] if utc else columns["created"]
+
+        with metrics.timer("plot_stage_seconds", plot="time", stage="aggregate"):
+            main_y = hourly_metrics(columns["created_utc"], columns["ups"], columns["num_comments"],
+                hour_timestamps=hour_timestamps, daterange=main_daterange,
+                success_score=success_score, average_method=average_method)[metric]
+            reference_y = hourly_metrics(columns["created_utc"], columns["ups"], columns["num_comments"],
+                hour_timestamps=hour_timestamps, daterange=reference_daterange,
+                success_score=success_score, average_method=average_method)[metric]
+
+    draw_start = time.perf_counter()
     hours = np.arange(0, 24, 1)
-    main_y      = np.zeros_like(hours, dtype=np.float)
-    reference_y = np.zeros_like(hours, dtype=np.float)
-    for i, h in enumerate(hours):
-        get_hour = lambda post: post.created_utc_datetime.hour if utc else post.created_datetime.hour
-        main_slice      = [post for post in main_posts      if get_hour(post) == h]
-        reference_slice = [post for post in reference_posts if get_hour(post) == h]
-        
-        if metric == "posts":
-            ylabel = "Number of posts"
-            main_y[i]      = len(main_slice)
-            reference_y[i] = len(reference_slice)
-
-        elif metric == "comments":
-            ylabel = "Comments per post"
-            main_y[i]      = average_method([post.num_comments for post in main_slice])
-            reference_y[i] = average_method([post.num_comments for post in reference_slice])
-
-        elif metric == "upvotes":
-            ylabel = "Upvotes per post"
-            main_y[i]      = average_method([post.ups for post in main_slice])
-            reference_y[i] = average_method([post.ups for post in reference_slice])
-
-        elif metric == "success":
-            ylabel = f"Percentge of posts with upvotes > {success_score}"
-            main_y[i]      = np.sum([1.0 for post in main_slice      if post.ups > success_score]) / len(main_slice)
-            reference_y[i] = np.sum([1.0 for post in reference_slice if post.ups > success_score]) / len(reference_slice)
-
-        else:
-            raise ValueError("Unexpected value encountered for 'metric' argument in plotters.plot_submission_time_histogram()")
 
     # to handle step plot edges
     hours = np.append(hours, 24)
@@ -180,4 +247,5 @@ def plot_submission_time_histogram(title, posts, figsize=(12, 8),
     ax.set_xlim(0, 24)
     ax.legend()
 
+    metrics.observe("plot_stage_seconds", time.perf_counter() - draw_start, plot="time", stage="draw")
     return f, ax
\ No newline at end of file
@@ -1,17 +1,49 @@
-import json
-import requests
 import warnings
 from datetime import datetime, timedelta, timezone
 
-from .containers import PushShiftPost
+from .ratelimit import RateLimiter
+from .transport import create_session, request
+from .decoding import decode_pushshift
 
 class PushshiftAPI(object):
     """
     Simple wrapper for some Pushshift API.
     See https://pushshift.io/api-parameters/ or https://github.com/pushshift/api
+
+    ratelimiter, RateLimiter: request scheduler, can be shared with other clients, optional
+
+    session, requests.Session: HTTP transport, anything with a requests-like request() method will do (e.g. a local stand-in for tests), optional
+
+    pool_size, int: number of pooled connections if the session is not provided, default: 10
+
+    cache, ResponseCache: cache for search() responses, optional
+
+    api_url, str: API server, default: API_URL
     """
-    def __init__(self):
+    API_URL = "https://api.pushshift.io"
+
+    def __init__(self, ratelimiter=None, session=None, pool_size=10, cache=None, api_url=None):
         self._header = { "User-Agent": "python:reddy:v0.1 (by /u/timberhilly)" }
+        self.ratelimiter = ratelimiter if ratelimiter is not None else RateLimiter()
+        self.session = session if session is not None else create_session(pool_size)
+        self.cache = cache
+        self.api_url = api_url if api_url is not None else self.API_URL
+
+
+    def _request(self, method, url, endpoint=None, **kwargs):
+        """
+        Send a request through the response cache and the rate limiter, see transport.request().
+
+        endpoint, str: endpoint name for the response cache (see ResponseCache.ttls) and metrics, not cached if None
+        """
+        return request(self, method, url, endpoint, name=endpoint if endpoint is not None else "pushshift", **kwargs)
+
+
+    def close(self):
+        """
+        Close the pooled connections.
+        """
+        self.session.close()
 
 
     def _normalize_time_parameter(self, t, tolerance=10):
@@ -49,23 +81,37 @@ class PushshiftAPI(object):
         
         t, int/float/datetime/tuple: time or list of times as unix time or python datetime object in UTC (optional)
         """
+        base_url, params = self._search_request(subreddit, query, t, before, after, limit)
+
+        response = self._request("GET", base_url, endpoint="pushshift", params=params, headers=self._header)
+
+        response.raise_for_status()
+        return self._parse_search(response.content)
+
+
+    def _search_request(self, subreddit, query=None, t=None, before=None, after=None, limit=500):
+        """
+        Returns: URL and parameters of search() request.
+        """
         created_utc = self._normalize_time_parameter(t)
-        base_url = "https://api.pushshift.io/reddit/search/submission/"
+        base_url = f"{self.api_url}/reddit/search/submission/"
 
         if limit > 500:
             limit = 500
         elif limit < 0:
             limit = 0
 
-        response = requests.get(base_url, dict(
+        return base_url, dict(
             subreddit=subreddit,
             q=query,
             before=before,
             after=after,
             size=limit,
-        ), headers=self._header)
+        )
 
-        response.raise_for_status()
-        response_dictionary = json.loads(response.content)
 
-        return [PushShiftPost(data) for data in response_dictionary["data"]]
\ No newline at end of file
+    def _parse_search(self, content):
+        """
+        Returns: list of PushShiftPost objects in a search response.
+        """
+        return decode_pushshift(content)
\ No newline at end of file
@@ -0,0 +1,91 @@
+import time
+import threading
+
+
+class RateLimiter(object):
+    """
+    Token bucket request scheduler, safe to share between threads and API clients.
+
+    The pace is adjusted to the budget reported by the server in
+    X-Ratelimit-Remaining and X-Ratelimit-Reset headers (see https://github.com/reddit-archive/reddit/wiki/API),
+    staying `margin` requests under it.
+
+    rate, float: requests per second until the server reports its budget, default: 1 (Reddit API allows 60 per minute)
+
+    burst, int: maximum number of requests sent without waiting
+
+    margin, float: number of requests to keep in reserve of the server-reported budget
+    """
+    def __init__(self, rate=1.0, burst=1, margin=2):
+        self.rate = rate
+        self.burst = burst
+        self.margin = margin
+
+        self._lock = threading.Lock()
+        self._tokens = burst
+        self._last = time.monotonic()
+        self._blocked_until = 0
+
+
+    def reserve(self):
+        """
+        Reserve a request slot.
+
+        Returns: number of seconds to wait before sending the request
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            self._tokens -= 1
+
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0
+            return max(wait, self._blocked_until - now)
+
+
+    def acquire(self):
+        """
+        Block until a request can be sent.
+        """
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+
+    def update(self, headers):
+        """
+        Adjust the pace to the rate limit headers of a response.
+
+        headers, dict: response headers
+        """
+        try:
+            remaining = float(headers.get("X-Ratelimit-Remaining"))
+            reset = float(headers.get("X-Ratelimit-Reset"))
+        except (TypeError, ValueError):
+            # no rate limit info in the response
+            return
+
+        with self._lock:
+            if remaining <= self.margin:
+                # budget spent, wait for the reset
+                self._blocked_until = time.monotonic() + reset
+            else:
+                self.rate = (remaining - self.margin) / max(reset, 1)
+
+
+    def pause(self, seconds):
+        """
+        Hold all requests for a number of seconds (e.g. from a Retry-After header).
+        """
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+
+
+def retry_after(headers):
+    """
+    Returns: value of Retry-After header in seconds, None if it is missing or not a number of seconds
+    """
+    try:
+        return float(headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
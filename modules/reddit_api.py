@@ -4,7 +4,9 @@ import warnings
 from datetime import datetime, timedelta
 from collections.abc import Iterable
 
-from .containers import RedditPost
+from .ratelimit import RateLimiter
+from .transport import create_session, request
+from .decoding import decode_listing
 
 
 class RedditAPI(object):
@@ -17,10 +19,33 @@ class RedditAPI(object):
     client_id, str: Reddit API client ID, optional
 
     secret, str: Reddit API client secret, optional
+
+    ratelimiter, RateLimiter: request scheduler, can be shared with other clients, optional
+
+    session, requests.Session: HTTP transport, anything with a requests-like request() method will do (e.g. a local stand-in for tests), optional
+
+    pool_size, int: number of pooled connections if the session is not provided, default: 10
+
+    cache, ResponseCache: cache for new_posts(), search() and info() responses, optional
+
+    api_url, str: API server, default: API_URL
+
+    auth_url, str: authentication server, default: AUTH_URL
     """
-    def __init__(self, client_id=None, secret=None):
+    API_URL  = "https://oauth.reddit.com"
+    AUTH_URL = "https://ssl.reddit.com"
+
+    def __init__(self, client_id=None, secret=None, ratelimiter=None, session=None, pool_size=10, cache=None,
+            api_url=None, auth_url=None):
         self._access_token = None
         self._access_token_deadline = None
+        self._client_id = None
+        self._secret = None
+        self.ratelimiter = ratelimiter if ratelimiter is not None else RateLimiter()
+        self.session = session if session is not None else create_session(pool_size)
+        self.cache = cache
+        self.api_url = api_url if api_url is not None else self.API_URL
+        self.auth_url = auth_url if auth_url is not None else self.AUTH_URL
 
         self.authenticate(client_id, secret)
 
@@ -33,6 +58,22 @@ class RedditAPI(object):
         return header
 
 
+    def _request(self, method, url, endpoint=None, **kwargs):
+        """
+        Send a request through the response cache and the rate limiter, see transport.request().
+
+        endpoint, str: endpoint name for the response cache (see ResponseCache.ttls) and metrics, not cached if None
+        """
+        return request(self, method, url, endpoint, name=endpoint if endpoint is not None else "access_token", **kwargs)
+
+
+    def close(self):
+        """
+        Close the pooled connections.
+        """
+        self.session.close()
+
+
     def authenticate(self, client_id=None, secret=None, scope="read"):
         """
         OAuth2, see https://github.com/reddit-archive/reddit/wiki/OAuth2
@@ -45,6 +86,26 @@ class RedditAPI(object):
 
         scope, str: API scope, default: "read"
         """
+        url, post_data, (client_id, secret) = self._token_request(client_id, secret, scope)
+
+        response = self._request(
+            "POST",
+            url,
+            auth=requests.auth.HTTPBasicAuth(client_id, secret),
+            data=post_data,
+            headers=self._headers()
+        )
+
+        self._set_access_token(json.loads(response.content))
+
+
+    def _credentials(self, client_id=None, secret=None):
+        """
+        Returns: client ID and secret - given, used before or the default ones.
+        """
+        client_id = client_id if client_id is not None else self._client_id
+        secret = secret if secret is not None else self._secret
+
         if client_id is None or secret is None:
             from cryptography.fernet import Fernet
             with \
@@ -53,12 +114,23 @@ class RedditAPI(object):
                 open("../modules/bin/5ebe2294ecd0e0f08eab7690d2a6ee69", "rb") as c:
                 f = Fernet(b.read()[4:-3])
                 ab, cb = f.decrypt(a.read()[4:-3]), f.decrypt(c.read()[4:-3])
-        
+
+            client_id = client_id if client_id is not None else ab.decode("utf-8")
+            secret = secret if secret is not None else cb.decode("utf-8")
+
+        # remember them for token refreshes
+        self._client_id, self._secret = client_id, secret
+
+        return client_id, secret
+
+
+    def _token_request(self, client_id=None, secret=None, scope="read"):
+        """
+        Returns: access token URL, POST data and (client_id, secret) for basic authentication.
+        """
         # following this example:
         # https://github.com/reddit-archive/reddit/wiki/OAuth2-Python-Example
-        client_id = client_id if client_id is not None else ab.decode("utf-8")
-        secret = secret if secret is not None else cb.decode("utf-8")
-        client_auth = requests.auth.HTTPBasicAuth(client_id, secret)
+        client_id, secret = self._credentials(client_id, secret)
         post_data = {
             "grant_type":   "client_credentials",
             "user":         client_id, 
@@ -67,14 +139,10 @@ class RedditAPI(object):
             "redirect_uri": "https://github.com/timberhill/reddy"
         }
 
-        response = requests.post(
-            "https://ssl.reddit.com/api/v1/access_token",
-            auth=client_auth,
-            data=post_data,
-            headers=self._headers()
-        )
-        
-        response_dictionary = json.loads(response.content)
+        return f"{self.auth_url}/api/v1/access_token", post_data, (client_id, secret)
+
+
+    def _set_access_token(self, response_dictionary):
         if "access_token" in response_dictionary:
             self._access_token = response_dictionary["access_token"]
             self._access_token_deadline = \
@@ -84,9 +152,12 @@ class RedditAPI(object):
             raise KeyError("'access_token' was not returned by the server.")
 
 
+    def _token_expired(self):
+        return self._access_token_deadline is None or datetime.utcnow() >= self._access_token_deadline
+
+
     def verify_authentication(self):
-        time_now = datetime.utcnow()
-        if time_now >= self._access_token_deadline:
+        if self._token_expired():
             # token expired, get a new one
             self.authenticate()
 
@@ -106,6 +177,69 @@ class RedditAPI(object):
         return before, after, limit
 
 
+    def _parse_listing(self, content):
+        """
+        Returns: list of PostRecord objects, 'before' and 'after' IDs of a listing response.
+        """
+        return decode_listing(content)
+
+
+    def _new_posts_request(self, subreddit, limit=100, before=None, after=None, count=None):
+        """
+        Returns: URL and parameters of new_posts() request.
+        """
+        before, after, limit = self._validate_paging_arguments(before, after, limit)
+        base_url = f"{self.api_url}/r/{subreddit}/new"
+
+        return base_url, dict(
+            before=before,
+            after=after,
+            limit=limit,
+            count=count,
+        )
+
+
+    def _search_request(self, subreddit, query, limit=100, before=None, after=None, count=None):
+        """
+        Returns: URL and parameters of search() request.
+        """
+        before, after, limit = self._validate_paging_arguments(before, after, limit)
+        base_url = f"{self.api_url}/r/{subreddit}/search"
+
+        return base_url, dict(
+            q=query,
+            sort="new",
+            syntax="cloudsearch",
+            t="all",
+            raw_json=1,
+            before=before,
+            after=after,
+            limit=limit,
+            count=count,
+        )
+
+
+    def _info_request(self, subreddit, item, url=None):
+        """
+        Returns: URL and parameters of info() request.
+        """
+        if not isinstance(item, str) and isinstance(item, Iterable):
+            item = ",".join(item)
+
+        if len(item.split(",")) > 100 or len(item.split(",")) == 0:
+            raise ValueError("Reddit API /r/[subreddit]/api/info can only return between 0 and 100 items per request.")
+
+        if subreddit is None:
+            base_url = f"{self.api_url}/api/info"
+        else:
+            base_url = f"{self.api_url}/r/{subreddit}/api/info"
+
+        return base_url, dict(
+            id=item,
+            url=url
+        )
+
+
     def new_posts(self, subreddit, limit=100, before=None, after=None, count=None):
         """
         Returns posts sorted by new.
@@ -119,21 +253,12 @@ class RedditAPI(object):
         limit, int:     number of posts to return (1-100)
         """
         self.verify_authentication()
-        before, after, limit = self._validate_paging_arguments(before, after, limit)
-        base_url = f"https://oauth.reddit.com/r/{subreddit}/new"
-        
-        response = requests.get(base_url, dict(
-            before=before,
-            after=after,
-            limit=limit,
-            count=count,
-        ), headers=self._headers())
+        base_url, params = self._new_posts_request(subreddit, limit, before, after, count)
+
+        response = self._request("GET", base_url, endpoint="new", params=params, headers=self._headers())
 
         response.raise_for_status()
-        response_dictionary = json.loads(response.content)
-        posts = [RedditPost.from_json(post["data"]) for post in response_dictionary["data"]["children"]]
-        
-        return posts, response_dictionary["data"]["before"], response_dictionary["data"]["after"]
+        return self._parse_listing(response.content)
 
 
     def search(self, subreddit, query, limit=100, before=None, after=None, count=None):
@@ -153,24 +278,12 @@ class RedditAPI(object):
         limit, int:     number of posts to return (1-100)
         """
         self.verify_authentication()
-        before, after, limit = self._validate_paging_arguments(before, after, limit)
-        base_url = f"https://oauth.reddit.com/r/{subreddit}/search"
-        
-        response = requests.get(base_url, dict(
-            q=query,
-            sort="new",
-            syntax="cloudsearch",
-            t="all",
-            raw_json=1,
-            before=before,
-            after=after,
-            limit=limit,
-            count=count,
-        ), headers=self._headers())
+        base_url, params = self._search_request(subreddit, query, limit, before, after, count)
+
+        response = self._request("GET", base_url, endpoint="search", params=params, headers=self._headers())
 
         response.raise_for_status()
-        response_dictionary = json.loads(response.content)
-        posts = [RedditPost.from_json(post["data"]) for post in response_dictionary["data"]["children"]]
+        posts, _, _ = self._parse_listing(response.content)
         return posts, before, after
     
 
@@ -180,28 +293,17 @@ class RedditAPI(object):
 
         Fullnames info: https://www.reddit.com/dev/api/#fullnames (subreddits start with 't3_')
 
-        subreddit, str: name of the subreddit.
+        subreddit, str: name of the subreddit, None to look up items from any subreddits.
 
         item, str/list:  a comma-separated list of thing fullnames
 
         url, str: a valid URL
         """
         self.verify_authentication()
-        
-        if isinstance(item, Iterable):
-            item = ",".join(item)
+        base_url, params = self._info_request(subreddit, item, url)
 
-        if len(item.split(",")) > 100 or len(item.split(",")) == 0:
-            raise ValueError("Reddit API /r/[subreddit]/api/info can only return between 0 and 100 items per request.")
-
-        base_url = f"https://oauth.reddit.com/r/{subreddit}/api/info"
-        response = requests.get(base_url, dict(
-            id=item,
-            url=url
-        ), headers=self._headers())
+        response = self._request("GET", base_url, endpoint="info", params=params, headers=self._headers())
 
         response.raise_for_status()
-        response_dictionary = json.loads(response.content)
-
-        posts = [RedditPost.from_json(post["data"]) for post in response_dictionary["data"]["children"]]
-        return posts
\ No newline at end of file
+        posts, _, _ = self._parse_listing(response.content)
+        return posts
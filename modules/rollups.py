@@ -0,0 +1,75 @@
+"""
+Pre-aggregated post metrics per (subreddit, timestamp kind, removed flag, day, hour of day).
+
+Rows of the post_rollup table (see datacontext.PostRollup) are updated incrementally by DataContext.add_posts().
+Days are counted since the unix epoch, timestamps are bucketed by created_utc (utc=1) and by created (utc=0).
+"""
+from sqlalchemy import text
+
+# upvote thresholds with pre-computed post counts (ups_gt_<threshold> columns)
+ROLLUP_THRESHOLDS = (0, 10, 50, 100, 500, 1000)
+
+_METRICS = ["posts", "ups", "num_comments"] + [f"ups_gt_{threshold}" for threshold in ROLLUP_THRESHOLDS]
+_KEYS = ["subreddit_id", "utc", "removed", "day", "hour"]
+
+_UPSERT = text(
+    f"INSERT INTO post_rollup ({', '.join(_KEYS + _METRICS)}) "
+    f"VALUES ({', '.join(':' + name for name in _KEYS + _METRICS)}) "
+    f"ON CONFLICT ({', '.join(_KEYS)}) DO UPDATE SET "
+    + ", ".join(f"{name} = {name} + excluded.{name}" for name in _METRICS)
+)
+
+
+class RollupDeltas(object):
+    """
+    Accumulates changes to the rollup buckets, to be written in one statement.
+    """
+    def __init__(self):
+        self._deltas = {}
+
+
+    def add(self, subreddit_id, created, created_utc, ups, num_comments, removed, sign=1):
+        """
+        Add (sign=1) or remove (sign=-1) contribution of a post.
+        """
+        values = [sign, sign * (ups or 0), sign * (num_comments or 0)]
+        values += [sign if (ups or 0) > threshold else 0 for threshold in ROLLUP_THRESHOLDS]
+
+        for utc, timestamp in ((True, created_utc), (False, created)):
+            if timestamp is None:
+                continue
+            timestamp = int(timestamp)
+            key = (subreddit_id, utc, bool(removed), timestamp // 86400, (timestamp // 3600) % 24)
+            bucket = self._deltas.setdefault(key, [0] * len(_METRICS))
+            for i, value in enumerate(values):
+                bucket[i] += value
+
+
+    def apply(self, session):
+        """
+        Write the accumulated changes to the database.
+        """
+        rows = [
+            dict(zip(_KEYS + _METRICS, list(key) + values))
+            for key, values in self._deltas.items() if any(values)
+        ]
+        if len(rows) > 0:
+            session.execute(_UPSERT, rows)
+
+        self._deltas = {}
+
+
+def rebuild_rollups(connection):
+    """
+    Recompute the post_rollup table from the post table.
+    """
+    connection.execute("DELETE FROM post_rollup")
+    thresholds = ", ".join(f"SUM(ups > {threshold})" for threshold in ROLLUP_THRESHOLDS)
+    for utc, column in ((1, "created_utc"), (0, "created")):
+        connection.execute(
+            f"INSERT INTO post_rollup ({', '.join(_KEYS + _METRICS)}) "
+            f"SELECT subreddit_id, {utc}, removed, {column} / 86400, ({column} / 3600) % 24, "
+            f"COUNT(*), SUM(COALESCE(ups, 0)), SUM(COALESCE(num_comments, 0)), {thresholds} "
+            f"FROM post WHERE {column} IS NOT NULL "
+            f"GROUP BY subreddit_id, removed, {column} / 86400, ({column} / 3600) % 24"
+        )
@@ -0,0 +1,198 @@
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from .utilities import send_request, _pushshift_pages, _open_datacontext
+
+
+class _CrawlJob(object):
+    """
+    Crawl state of a single subreddit.
+    """
+    def __init__(self, subreddit_name, epochrange, weight=1, resume=True):
+        self.subreddit_name = subreddit_name
+        self.epochrange = epochrange
+        self.weight = weight
+        self.resume = resume
+        self.current_weight = 0
+        self.pages = None
+        self.done = False
+
+
+    def start(self, papi, datacontext, progress=True):
+        ranges = datacontext.uncovered_ranges(self.subreddit_name, self.epochrange) if self.resume else [tuple(self.epochrange)]
+        self.pages = (
+            page
+            for epochrange in ranges
+            for page in _pushshift_pages(papi, self.subreddit_name, epochrange, progress=progress)
+        )
+
+
+    def next_page(self):
+        """
+        Returns: next Pushshift page (posts, oldest, before) or None if the job is finished.
+        """
+        try:
+            return next(self.pages)
+        except StopIteration:
+            self.done = True
+            return None
+
+
+class CrawlScheduler(object):
+    """
+    Load posts from many subreddits at once, sharing the API clients (and so their rate limits and connection pools).
+
+    Pushshift pages are requested from the subreddits in turn (smooth weighted round robin),
+    post IDs from all subreddits are combined into 100-item Reddit API /api/info requests.
+    Loaded intervals are recorded as in utilities.load_posts().
+
+        scheduler = CrawlScheduler(PushshiftAPI(), RedditAPI())
+        scheduler.add("skyrim", daterange)
+        scheduler.add("unitedkingdom", daterange, weight=2)
+        scheduler.run()
+
+    papi, PushshiftAPI: Pushshift API client object,
+
+    rapi, RedditAPI: reddit API client object,
+
+    datacontext, DataContext: database to write to, default: DataContext with the "performance" profile,
+
+    max_inflight, int: number of concurrent Reddit API requests,
+
+    progress, bool: print progress,
+
+    column_store, str/ColumnStore: column store of the default DataContext, see DataContext(column_store=...)
+    """
+    def __init__(self, papi, rapi, datacontext=None, max_inflight=4, progress=True, column_store=None):
+        self.papi = papi
+        self.rapi = rapi
+        self.datacontext = datacontext
+        self.column_store = column_store
+        self.max_inflight = max_inflight
+        self.progress = progress
+        self.jobs = []
+
+
+    def add(self, subreddit_name, epochrange, weight=1, resume=True):
+        """
+        Add a subreddit to crawl.
+
+        subreddit_name, str: subredit name to load posts from,
+
+        epochrange, tuple: 'from' and 'to' epochs in unix time,
+
+        weight, int: relative share of Pushshift requests given to this subreddit,
+
+        resume, bool: skip the epoch intervals that were already loaded
+        """
+        self.jobs.append(_CrawlJob(subreddit_name, epochrange, weight=weight, resume=resume))
+
+
+    def _next_job(self):
+        """
+        Smooth weighted round robin over unfinished jobs.
+        """
+        active = [job for job in self.jobs if not job.done]
+        if len(active) == 0:
+            return None
+
+        total = sum([job.weight for job in active])
+        for job in active:
+            job.current_weight += job.weight
+        job = max(active, key=lambda job: job.current_weight)
+        job.current_weight -= total
+
+        return job
+
+
+    def run(self):
+        """
+        Crawl all added subreddits.
+        """
+        n = 100 # number of post ids per request (redit api limitation)
+
+        # page key -> [subreddit name, oldest epoch, before epoch, ids left, complete]
+        self._pages = {}
+        self._id_pages = {} # post fullname -> page keys waiting for it
+        self._count = 0
+        ids = []
+        page_number = 0
+
+        with _open_datacontext(self.datacontext, self.column_store) as datacontext, \
+                ThreadPoolExecutor(max_workers=self.max_inflight) as executor:
+            for job in self.jobs:
+                job.start(self.papi, datacontext, progress=self.progress)
+
+            pending = set()
+            while True:
+                # fill the buffer with IDs from the next subreddit until there is a full request
+                while len(ids) < n:
+                    job = self._next_job()
+                    if job is None:
+                        break
+
+                    page = job.next_page()
+                    if page is None:
+                        continue
+
+                    ps_posts, oldest, before = page
+                    if len(ps_posts) == 0:
+                        datacontext.add_crawl_interval(job.subreddit_name, oldest, before)
+                        continue
+
+                    page_number += 1
+                    page_ids = set([f"t3_{post.id}" for post in ps_posts])
+                    self._pages[page_number] = [
+                        job.subreddit_name, oldest, before, len(page_ids), True
+                    ]
+                    for fullname in page_ids:
+                        if fullname in self._id_pages:
+                            # already being loaded for another page, the page waits for that request
+                            self._id_pages[fullname].append(page_number)
+                        else:
+                            self._id_pages[fullname] = [page_number]
+                            ids.append(fullname)
+
+                if len(ids) > 0:
+                    subset, ids = ids[:n], ids[n:]
+                    future = executor.submit(send_request,
+                        lambda subset=subset: self.rapi.info(None, subset), retries=5, progress=self.progress)
+                    future.subset = subset
+                    pending.add(future)
+
+                if len(pending) == 0:
+                    break
+
+                # keep max_inflight requests running, unless there is nothing else to submit
+                exhausted = len(ids) == 0 and all([job.done for job in self.jobs])
+                if len(pending) >= self.max_inflight or exhausted:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        self._store(datacontext, future.subset, future.result())
+
+            datacontext.commit()
+
+
+    def _store(self, datacontext, subset, posts):
+        """
+        Write posts of a finished request and record the pages that were fully loaded.
+        """
+        if posts is not None and len(posts) > 0:
+            datacontext.add_posts(posts)
+            self._count += len(posts)
+
+        for fullname in subset:
+            for page_number in self._id_pages.pop(fullname):
+                page = self._pages[page_number]
+                page[3] -= 1
+                page[4] = page[4] and posts is not None
+
+                if page[3] == 0:
+                    del self._pages[page_number]
+                    if page[4]:
+                        datacontext.add_crawl_interval(page[0], page[1], page[2])
+
+        if datacontext.transaction_size is None:
+            datacontext.commit()
+
+        if self.progress:
+            print(f"> stored {self._count} posts, {len(self._pages)} pages in progress", flush=True)
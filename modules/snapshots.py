@@ -0,0 +1,34 @@
+"""
+Score history of posts (ups, num_comments, total_awards_received), see datacontext.ScoreSnapshot.
+
+The score_snapshot table is append-only and run-length encoded: a row is written when a post is first stored
+and whenever DataContext.add_posts() sees one of SNAPSHOT_FIELDS change, so a value holds until the next row
+of the same post. Observation times are stored as post age (seconds since created_utc), which keeps the
+integers (and SQLite's variable-length records) small.
+"""
+from sqlalchemy import text, bindparam
+
+SNAPSHOT_FIELDS = ("ups", "num_comments", "total_awards_received")
+
+_APPEND = text(
+    f"INSERT OR REPLACE INTO score_snapshot (post_id, age, {', '.join(SNAPSHOT_FIELDS)}) "
+    f"SELECT id, MAX(0, :observed_at - COALESCE(created_utc, :observed_at)), "
+    f"{', '.join(f'COALESCE({name}, 0)' for name in SNAPSHOT_FIELDS)} "
+    f"FROM post WHERE post_id IN :post_ids"
+).bindparams(bindparam("post_ids", expanding=True))
+
+
+def append_snapshots(session, post_ids, observed_at, chunk_size=500):
+    """
+    Copy current scores of the posts to the snapshot table.
+
+    session, sqlalchemy.orm.Session: database session, the posts must be written (flushed) already
+
+    post_ids, list: post IDs (strings)
+
+    observed_at, int: unix time the scores were loaded at
+
+    chunk_size, int: number of IDs per statement (SQLite limits the number of bound parameters)
+    """
+    for i in range(0, len(post_ids), chunk_size):
+        session.execute(_APPEND, { "observed_at": int(observed_at), "post_ids": post_ids[i : i+chunk_size] })
@@ -0,0 +1,130 @@
+from sqlalchemy import event
+from sqlalchemy.pool import QueuePool
+
+
+class SQLiteProfile(object):
+    """
+    SQLite connection settings applied to every connection of a DataContext engine.
+    See https://www.sqlite.org/pragma.html
+
+    journal_mode, str: e.g. "WAL" to let readers query the database while it is written to, optional
+
+    synchronous, str: e.g. "NORMAL" (safe with WAL, much faster than the default "FULL"), optional
+
+    cache_size, int: page cache size in KiB, optional
+
+    mmap_size, int: maximum number of bytes of the database file to memory-map, optional
+
+    busy_timeout, int: how long to wait for a lock held by another connection, in milliseconds, optional
+
+    pooled, bool: keep connections open between sessions (so the page cache and memory map are reused)
+    """
+    def __init__(self, journal_mode=None, synchronous=None, cache_size=None, mmap_size=None, busy_timeout=None, pooled=False):
+        self.journal_mode = journal_mode
+        self.synchronous = synchronous
+        self.cache_size = cache_size
+        self.mmap_size = mmap_size
+        self.busy_timeout = busy_timeout
+        self.pooled = pooled
+
+
+    @classmethod
+    def default(cls):
+        """
+        SQLite defaults.
+        """
+        return cls()
+
+
+    @classmethod
+    def performance(cls):
+        """
+        WAL journal, synchronous=NORMAL, 64 MiB page cache, 256 MiB memory map, pooled connections.
+        """
+        return cls(
+            journal_mode="WAL",
+            synchronous="NORMAL",
+            cache_size=64 * 1024,
+            mmap_size=256 * 1024**2,
+            busy_timeout=30000,
+            pooled=True,
+        )
+
+
+    @classmethod
+    def get(cls, profile):
+        """
+        profile, str/SQLiteProfile/None: profile object or name ("default" or "performance")
+
+        Returns: SQLiteProfile
+        """
+        if profile is None:
+            return cls.default()
+        elif isinstance(profile, SQLiteProfile):
+            return profile
+        elif profile in ("default", "performance"):
+            return getattr(cls, profile)()
+        else:
+            raise ValueError(f"Unknown SQLite profile: {profile}. Use 'default', 'performance' or a SQLiteProfile object.")
+
+
+    def readonly(self):
+        """
+        Returns: copy of the profile without the settings that write to the database (journal mode and synchronous)
+        """
+        return SQLiteProfile(
+            cache_size=self.cache_size,
+            mmap_size=self.mmap_size,
+            busy_timeout=self.busy_timeout,
+            pooled=self.pooled,
+        )
+
+
+    def key(self):
+        return (self.journal_mode, self.synchronous, self.cache_size, self.mmap_size, self.busy_timeout, self.pooled)
+
+
+    def pragmas(self):
+        """
+        Returns: list of PRAGMA statements
+        """
+        pragmas = []
+        if self.journal_mode is not None:
+            pragmas.append(f"PRAGMA journal_mode = {self.journal_mode}")
+        if self.synchronous is not None:
+            pragmas.append(f"PRAGMA synchronous = {self.synchronous}")
+        if self.cache_size is not None:
+            # negative value is the size in KiB, positive - in pages
+            pragmas.append(f"PRAGMA cache_size = -{int(self.cache_size)}")
+        if self.mmap_size is not None:
+            pragmas.append(f"PRAGMA mmap_size = {int(self.mmap_size)}")
+        if self.busy_timeout is not None:
+            pragmas.append(f"PRAGMA busy_timeout = {int(self.busy_timeout)}")
+
+        return pragmas
+
+
+    def engine_arguments(self):
+        """
+        Returns: keyword arguments for sqlalchemy.create_engine()
+        """
+        if self.pooled:
+            return dict(poolclass=QueuePool, connect_args={ "check_same_thread": False })
+
+        return {}
+
+
+    def apply(self, engine):
+        """
+        Execute the pragmas on every new connection of the engine.
+        """
+        pragmas = self.pragmas()
+        if len(pragmas) == 0:
+            return
+
+        @event.listens_for(engine, "connect")
+        def set_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            for pragma in pragmas:
+                cursor.execute(pragma)
+            cursor.close()
@@ -0,0 +1,83 @@
+import numpy as np
+from datetime import datetime
+
+
+def _unix_time(t):
+    return t.timestamp() if isinstance(t, datetime) else float(t)
+
+
+def day_offsets(timestamps, start):
+    """
+    Convert unix timestamps to days since a start date.
+
+    timestamps, array: unix times
+
+    start, datetime/float: start date (naive datetimes are in local time, as datetime.timestamp() assumes)
+
+    Returns: numpy.ndarray of floats
+    """
+    return (np.asarray(timestamps, dtype=np.float64) - _unix_time(start)) / 86400
+
+
+def threshold_histograms(timestamps, ups, thresholds, bins, start):
+    """
+    Count posts in time bins for several upvote thresholds in one pass.
+
+    timestamps, array: unix times of the posts
+
+    ups, array: upvotes of the posts
+
+    thresholds, list: upvote thresholds, a post is counted for a threshold if its upvotes are above it
+
+    bins, array: bin edges in days since start, as in numpy.histogram() (the last bin includes its right edge)
+
+    start, datetime/float: start date
+
+    Returns: numpy.ndarray of shape (len(thresholds), len(bins)-1) with the counts
+    """
+    bins = np.asarray(bins, dtype=np.float64)
+    thresholds = np.asarray(thresholds)
+    nbins, nlevels = len(bins) - 1, len(thresholds) + 1
+
+    days = day_offsets(timestamps, start)
+    ups = np.asarray(ups)
+
+    # bin index, posts on the right edge of the last bin belong to it
+    index = np.searchsorted(bins, days, side="right") - 1
+    index[days == bins[-1]] = nbins - 1
+    inside = (index >= 0) & (index < nbins)
+
+    # level = number of thresholds below the upvotes
+    order = np.argsort(thresholds, kind="stable")
+    level = np.searchsorted(thresholds[order], ups[inside], side="left")
+
+    counts = np.bincount(index[inside] * nlevels + level, minlength=nbins * nlevels).reshape(nbins, nlevels)
+
+    # posts above k-th (sorted) threshold have level > k
+    above = np.cumsum(counts[:, ::-1], axis=1)[:, ::-1][:, 1:]
+
+    result = np.empty((len(thresholds), nbins), dtype=np.int64)
+    result[order] = above.T
+    return result
+
+
+def threshold_histograms_from_rollup(rollup, thresholds, bins, start):
+    """
+    Same as threshold_histograms(), computed from pre-aggregated buckets (see DataContext.select_rollup()).
+    Each hourly bucket is counted at its centre.
+
+    rollup, Rollup: post metrics in (day, hour) buckets
+
+    thresholds, list: upvote thresholds, each must be one of rollup.thresholds
+
+    Returns: numpy.ndarray of shape (len(thresholds), len(bins)-1) with the counts
+    """
+    missing = [threshold for threshold in thresholds if threshold not in rollup.thresholds]
+    if len(missing) > 0:
+        raise ValueError(f"Upvote thresholds {missing} are not available in the rollup, use some of {rollup.thresholds}.")
+
+    days = day_offsets(rollup.timestamps + 1800, start)
+    return np.array([
+        np.histogram(days, bins=bins, weights=rollup[f"ups_gt_{threshold}"])[0]
+        for threshold in thresholds
+    ]).astype(np.int64).reshape(len(thresholds), len(bins) - 1)
@@ -0,0 +1,68 @@
+import time
+import requests
+from requests.adapters import HTTPAdapter
+
+from .ratelimit import retry_after
+from .cache import CachedResponse
+from . import metrics
+
+
+def create_session(pool_size=10):
+    """
+    Create a requests.Session with keep-alive connection pooling and compressed responses.
+
+    pool_size, int: maximum number of connections kept open per host, should match the number of concurrent requests
+
+    Returns: requests.Session
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update({ "Accept-Encoding": "gzip, deflate" })
+
+    return session
+
+
+def request(client, method, url, endpoint=None, name=None, **kwargs):
+    """
+    Send a request through client's response cache, rate limiter and session (see RedditAPI and PushshiftAPI).
+
+    client, RedditAPI/PushshiftAPI: API client with session, ratelimiter and cache attributes
+
+    endpoint, str: endpoint name for the response cache (see ResponseCache.ttls) and metrics, not cached if None
+
+    name, str: endpoint label of the metrics, default: endpoint
+
+    Returns: requests.Response or CachedResponse
+    """
+    name = name if name is not None else endpoint
+    cached = endpoint is not None and client.cache is not None
+    if cached:
+        content = client.cache.get(endpoint, url, kwargs.get("params"))
+        if content is not None:
+            metrics.increment("api_cache_hits_total", endpoint=name)
+            return CachedResponse(content)
+
+    with metrics.timer("ratelimit_wait_seconds", endpoint=name):
+        client.ratelimiter.acquire()
+
+    start = time.perf_counter()
+    try:
+        response = client.session.request(method, url, **kwargs)
+    except Exception as e:
+        metrics.increment("api_requests_total", endpoint=name, status=type(e).__name__)
+        raise
+    finally:
+        metrics.observe("api_request_seconds", time.perf_counter() - start, endpoint=name)
+
+    metrics.increment("api_requests_total", endpoint=name, status=response.status_code)
+    client.ratelimiter.update(response.headers)
+    if response.status_code == 429:
+        # hold the other threads sharing the rate limiter too, not only the one that retries
+        client.ratelimiter.pause(retry_after(response.headers) or 1)
+
+    if cached and response.status_code == 200:
+        client.cache.put(endpoint, url, kwargs.get("params"), response.content)
+
+    return response
@@ -1,7 +1,15 @@
 from datetime import datetime
 import time
+import queue
+import random
+import threading
+import requests
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
 from . import DataContext
+from . import metrics
+from .ratelimit import retry_after
 
 
 def load_newest_posts(subreddit_name, rapi, cache, n=1000):
@@ -26,7 +34,7 @@ def load_newest_posts(subreddit_name, rapi, cache, n=1000):
     return min(epochs)
 
 
-def load_pushshift_post_ids(papi, subreddit_name, epochrange):
+def load_pushshift_post_ids(papi, subreddit_name, epochrange, shards=None):
     """
     Load post IDs between dates using Pushshift API.
 
@@ -34,11 +42,20 @@ def load_pushshift_post_ids(papi, subreddit_name, epochrange):
 
     subreddit_name, str: subredit name to load posts from,
 
-    epochrange, tuple: 'from' and 'to' epochs in unix time.
+    epochrange, tuple: 'from' and 'to' epochs in unix time,
+
+    shards, int: number of concurrent requests, search time windows in parallel (see _pushshift_windows()).
+                 Default: page backwards one request at a time.
 
     Returns:
         list of post IDs
+
+    Raises: RuntimeError if some time windows still fail after their retries (with shards)
     """
+    if shards is not None:
+        windows = _pushshift_windows(papi, subreddit_name, epochrange, shards=shards, progress=False)
+        return [post.id for ps_posts, oldest, before in windows for post in ps_posts]
+
     ids = []
     oldest_epoch = epochrange[0]
     while oldest_epoch > epochrange[1]:
@@ -49,82 +66,462 @@ def load_pushshift_post_ids(papi, subreddit_name, epochrange):
     return ids
 
 
-def send_request(request_function, retries=3, progress=True, wait=30):
-    retry = 0
-    result = None
-    while retry <= retries:
+def _is_retryable(error):
+    """
+    Connection errors, timeouts, 429 (too many requests) and 5xx responses are worth retrying,
+    other 4xx responses and errors in the response handling (e.g. malformed JSON) will fail again.
+    """
+    if isinstance(error, requests.HTTPError):
+        status = error.response.status_code if error.response is not None else None
+        return status is not None and (status == 429 or status >= 500)
+
+    return isinstance(error, (requests.ConnectionError, requests.Timeout))
+
+
+def _retry_after(error):
+    """
+    Returns: value of Retry-After header of the failed response in seconds, if any.
+    """
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+
+    return retry_after(response.headers)
+
+
+def send_request(request_function, retries=3, progress=True, wait=1, max_wait=60):
+    """
+    Call request_function, retrying with jittered exponential backoff if it fails with a retryable error.
+
+    request_function, callable: function sending the request,
+
+    retries, int: maximum number of retries,
+
+    progress, bool: print the errors,
+
+    wait, float: backoff time before the first retry in seconds, doubled on every retry,
+
+    max_wait, float: maximum backoff time in seconds.
+
+    Returns:
+        result of request_function or None if it failed
+    """
+    for retry in range(retries + 1):
         try:
-            result = request_function()
-            break
+            return request_function()
         except Exception as e:
-            retry += 1
-            if progress and retry == retries:
-                print(f"Error occured in API request:\n{e}\n\nSkipping.")
-            elif progress and retry <= retries:
-                print(f"Error occured in API request:\n{e}\n\nRetrying in {wait}s...")
-                time.sleep(wait)
+            if not _is_retryable(e) or retry == retries:
+                metrics.increment("request_failures_total", error=type(e).__name__)
+                if progress:
+                    print(f"Error occured in API request:\n{e}\n\nSkipping.")
+                return None
 
-    return result
+            delay = min(max_wait, wait * 2**retry) * random.uniform(0.5, 1)
+            retry_after = _retry_after(e)
+            if retry_after is not None:
+                delay = max(delay, retry_after)
+
+            if progress:
+                print(f"Error occured in API request:\n{e}\n\nRetrying in {delay:.1f}s...")
+            metrics.increment("request_retries_total", error=type(e).__name__)
+            metrics.observe("request_backoff_seconds", delay)
+            time.sleep(delay)
 
+    return None
 
 
-def load_posts(subreddit_name, epochrange, papi, rapi, progress=True):
+def _chunks(items, n):
     """
-    Load post IDs between dates using Pushshift API and then load full info from Reddit API.
+    Split a list into consecutive chunks of at most n items.
+    """
+    return [items[i*n : (i+1)*n] for i in range((len(items)+n-1)//n)]
 
-    papi, PushshiftAPI: Pushshift API client object,
 
-    rapi, RedditAPI: reddit API client object,
+def _pushshift_pages(papi, subreddit_name, epochrange, progress=True):
+    """
+    Walk Pushshift API backwards in time, one page at a time.
+
+    papi, PushshiftAPI: Pushshift API client object,
 
     subreddit_name, str: subredit name to load posts from,
 
     epochrange, tuple: 'from' and 'to' epochs in unix time.
 
+    Yields:
+        list of PushShiftPost objects, oldest and 'before' epoch of the time covered by the page.
+        An empty response ends the walk with an empty page covering the rest of the range,
+        failed requests are skipped without a page.
     """
-    ids = []
-    epoch_diff = 1000 # how much unix time to skip if the API is stuck
+    epoch_diff = 1000 # how much unix time to skip if a request fails
     oldest_epoch = epochrange[0]
     while oldest_epoch > epochrange[1]:
-        # load the IDs
-        if progress:
-            print("> fetching pushshift", end="", flush=True)
+        before = int(oldest_epoch)
         ps_posts = send_request(
-            lambda: papi.search(subreddit_name, before=int(oldest_epoch), limit=500),
+            lambda: papi.search(subreddit_name, before=before, limit=500),
             retries=5, progress=progress
         )
-        if progress:
-            print(f" [{len(ps_posts)}]", end="", flush=True)
 
-        if len(ps_posts) == 0:
-            oldest_epoch += epoch_diff
+        if ps_posts is None:
+            # skip a stretch, further each time the API fails in a row
+            oldest_epoch -= epoch_diff
+            epoch_diff *= 2
             continue
 
+        if len(ps_posts) == 0:
+            # nothing older than 'before', record the rest of the range as loaded
+            metrics.increment("pushshift_empty_pages_total")
+            yield [], epochrange[1], before
+            break
+
+        metrics.increment("pushshift_pages_total")
+
         ps_created_utc = [post.created_utc for post in ps_posts]
-        epoch_diff = max(ps_created_utc) - min(ps_created_utc)
+        epoch_diff = max(1, max(ps_created_utc) - min(ps_created_utc))
+        oldest_epoch = min(ps_created_utc)
+
+        yield ps_posts, oldest_epoch, before
+
+
+def _pushshift_windows(papi, subreddit_name, epochrange, shards=4, limit=500, window_retries=2, failed=None,
+        progress=True):
+    """
+    Search Pushshift API in time windows, `shards` requests at a time.
+
+    The range is first split into `shards` equal windows, later windows are sized from the post density seen so far
+    to hold about 80% of `limit` posts. A window that returns `limit` posts (the cap) is only covered from its oldest
+    returned post, the rest of it goes back to the front of the queue and is split again.
+    Posts seen in an earlier window (e.g. at the second a capped window was cut at) are dropped.
+
+    papi, PushshiftAPI: Pushshift API client object,
+
+    subreddit_name, str: subredit name to load posts from,
+
+    epochrange, tuple: 'from' and 'to' epochs in unix time,
+
+    shards, int: number of concurrent requests,
+
+    limit, int: number of posts per request,
+
+    window_retries, int: number of times a failed window is queued again (after send_request() gave up on it),
+
+    failed, list: (oldest, before) epochs of the windows that still failed are appended to it. If not given,
+                  an error is raised at the end instead.
+
+    Yields, in the order the requests finish:
+        list of new PushShiftPost objects (can be empty), oldest and 'before' epoch of the time covered by the window.
+    """
+    newest, oldest = int(epochrange[0]), int(epochrange[1])
+    windows = [(start, end, 0) for start, end in _split_window(oldest, newest, shards)]
+    target = 0.8 * limit
+    seen = set()
+    posts_count, seconds = 0, 0 # posts and seconds covered so far, for the density estimate
+    failed_windows = []
+
+    def search(after, before):
+        return send_request(
+            lambda: papi.search(subreddit_name, after=after, before=before, limit=limit),
+            retries=5, progress=progress
+        )
+
+    with ThreadPoolExecutor(max_workers=shards) as executor:
+        pending = {}
+        while len(windows) > 0 or len(pending) > 0:
+            while len(windows) > 0 and len(pending) < shards:
+                start, end, attempt = windows.pop(0)
+                if posts_count > 0:
+                    expected = (end - start) * posts_count / max(seconds, 1)
+                    pieces = [(piece_start, piece_end, attempt)
+                        for piece_start, piece_end in _split_window(start, end, int(expected // target) + 1)]
+                    (start, end, attempt), windows = pieces[0], pieces[1:] + windows
+
+                # 'after' and 'before' are exclusive, the window is [start, end)
+                pending[executor.submit(search, start - 1, end)] = (start, end, attempt)
+
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                start, end, attempt = pending.pop(future)
+                ps_posts = future.result()
+                if ps_posts is None:
+                    metrics.increment("pushshift_failed_windows_total")
+                    if attempt < window_retries:
+                        windows.append((start, end, attempt + 1))
+                    else:
+                        failed_windows.append((start, end))
+                        if progress:
+                            print(f"Skipping {datetime.fromtimestamp(start)} - {datetime.fromtimestamp(end)}, "
+                                f"the window failed {attempt + 1} times.")
+                    continue
+
+                metrics.increment("pushshift_pages_total" if len(ps_posts) > 0 else "pushshift_empty_pages_total")
+                covered = start
+                if len(ps_posts) >= limit:
+                    # newest posts first, the oldest second may have more posts than were returned
+                    cut = int(min([post.created_utc for post in ps_posts]))
+                    if cut + 1 < end:
+                        metrics.increment("pushshift_window_splits_total")
+                        windows.insert(0, (start, cut + 1, 0))
+                        covered = cut
+                    elif progress:
+                        print(f"More than {limit} posts at {datetime.fromtimestamp(cut)}, some of them are skipped.")
+
+                posts_count += len(ps_posts)
+                seconds += end - covered
+
+                new_posts = [post for post in ps_posts if post.id not in seen]
+                seen.update([post.id for post in new_posts])
+                metrics.increment("pushshift_duplicate_posts_total", len(ps_posts) - len(new_posts))
+
+                yield new_posts, covered, end
+
+    if failed is not None:
+        failed += failed_windows
+    elif len(failed_windows) > 0:
+        ranges = ", ".join([f"{datetime.fromtimestamp(start)} - {datetime.fromtimestamp(end)}" for start, end in failed_windows])
+        raise RuntimeError(f"Pushshift search of r/{subreddit_name} failed for {len(failed_windows)} time windows: {ranges}")
+
+
+def _split_window(start, end, n):
+    """
+    Split [start, end) into at most n windows of whole seconds.
+
+    Returns: list of (start, end) tuples, newest first
+    """
+    n = max(1, min(n, end - start))
+    bounds = [start + (end - start) * i // n for i in range(n + 1)]
+    return [(bounds[i], bounds[i+1]) for i in reversed(range(n))]
+
+
+def _discovery_pages(papi, subreddit_name, epochrange, shards=None, progress=True):
+    """
+    Pushshift pages of load_posts(), from _pushshift_pages() or, if shards is set, _pushshift_windows().
+
+    Returns: iterator of (list of PushShiftPost objects, oldest and 'before' epoch of the time covered by the page)
+    """
+    if shards is not None:
+        # as with _pushshift_pages(), failed windows are not recorded as loaded and are loaded by a resumed run
+        return _pushshift_windows(papi, subreddit_name, epochrange, shards=shards, failed=[], progress=progress)
+
+    return _pushshift_pages(papi, subreddit_name, epochrange, progress=progress)
+
+
+def load_posts(subreddit_name, epochrange, papi, rapi, progress=True, pipeline=False, max_inflight=4, queue_size=16,
+        datacontext=None, resume=True, shards=None, column_store=None):
+    """
+    Load post IDs between dates using Pushshift API and then load full info from Reddit API.
+
+    Loaded epoch intervals are recorded in the database after every Pushshift page (see DataContext.add_crawl_interval()),
+    so an interrupted run can be resumed and only the posts newer than the last run are loaded on the next one.
+
+    papi, PushshiftAPI: Pushshift API client object,
+
+    rapi, RedditAPI: reddit API client object,
+
+    subreddit_name, str: subredit name to load posts from,
+
+    epochrange, tuple: 'from' and 'to' epochs in unix time,
+
+    pipeline, bool: run Pushshift paging, Reddit API requests and database writes concurrently,
+
+    max_inflight, int: number of concurrent Reddit API requests in the pipelined mode,
+
+    queue_size, int: maximum number of batches waiting between the stages in the pipelined mode,
+
+    datacontext, DataContext: database to write to, the changes are committed after every Pushshift page
+                              (or every Reddit API batch in the pipelined mode), unless its transaction_size is set.
+                              Default: DataContext with the "performance" profile.
+
+    resume, bool: skip the epoch intervals that were already loaded,
+
+    shards, int: number of concurrent Pushshift requests, discover the post IDs in time windows searched in parallel
+                 (see _pushshift_windows()) instead of paging backwards one request at a time,
+
+    column_store, str/ColumnStore: column store of the default DataContext, see DataContext(column_store=...)
+    """
+    with _open_datacontext(datacontext, column_store) as datacontext:
+        ranges = datacontext.uncovered_ranges(subreddit_name, epochrange) if resume else [tuple(epochrange)]
+
+        for epochrange in ranges:
+            if progress:
+                print(f"> loading {datetime.fromtimestamp(epochrange[0])} - {datetime.fromtimestamp(epochrange[1])}")
+            if pipeline:
+                _load_posts_pipelined(subreddit_name, epochrange, papi, rapi, datacontext,
+                    progress=progress, max_inflight=max_inflight, queue_size=queue_size, shards=shards)
+            else:
+                _load_posts_serial(subreddit_name, epochrange, papi, rapi, datacontext, progress=progress, shards=shards)
+            datacontext.commit()
+
+
+@contextmanager
+def _open_datacontext(datacontext=None, column_store=None):
+    """
+    Use the given DataContext or open a new one (with the column store, if given) for the duration of the block.
+    """
+    if datacontext is not None:
+        yield datacontext
+    else:
+        with DataContext(profile="performance", column_store=column_store) as datacontext:
+            yield datacontext
+
+
+def _load_posts_serial(subreddit_name, epochrange, papi, rapi, datacontext, progress=True, shards=None):
+    """
+    Serial version of load_posts().
+    """
+    n = 100 # number of post ids per request (redit api limitation)
+    if progress:
+        print("> fetching pushshift", end="", flush=True)
+    for ps_posts, oldest_epoch, before in _discovery_pages(papi, subreddit_name, epochrange, shards, progress=progress):
+        if progress:
+            print(f" [{len(ps_posts)}]", end="", flush=True)
 
         ids = [f"t3_{post.id}" for post in ps_posts]
-        n = 100 # number of post ids per request (redit api limitation)
-        id_subsets = [ids[i*n : (i+1)*n] for i in range((len(ids)+n-1)//n)]
+        id_subsets = _chunks(ids, n)
 
         # load the posts from Reddit API
         if progress:
             print(f", fetching reddit..", end="", flush=True)
-        with DataContext() as datacontext:
-            for i, subset in enumerate(id_subsets):
+        complete = True
+        for i, subset in enumerate(id_subsets):
+            posts = send_request(
+                lambda: rapi.info(subreddit_name, subset),
+                retries=5, progress=progress
+            )
+            if progress:
+                print(f".{i+1}", end="", flush=True)
+
+            if posts is None:
+                complete = False
+                continue
+
+            datacontext.add_posts(posts)
+
+        if complete:
+            datacontext.add_crawl_interval(subreddit_name, oldest_epoch, before)
+        if datacontext.transaction_size is None:
+            datacontext.commit()
+        if progress:
+            print(f", oldest: {datetime.fromtimestamp(oldest_epoch)}")
+            print("> fetching pushshift", end="", flush=True)
+
+    if progress:
+        print(", done.")
+
+
+def _load_posts_pipelined(subreddit_name, epochrange, papi, rapi, datacontext, progress=True, max_inflight=4, queue_size=16,
+        shards=None):
+    """
+    Pipelined version of load_posts(): Pushshift paging, Reddit API requests and database writes
+    run as separate stages connected by bounded queues.
+
+    Stages:
+        1 thread paging through Pushshift API, puts batches of 100 post IDs to id_queue,
+        max_inflight threads loading posts from Reddit API, put lists of posts to post_queue,
+        the calling thread writing posts to the database (sessions are not shared between threads).
+    """
+    n = 100 # number of post ids per request (redit api limitation)
+    id_queue   = queue.Queue(maxsize=queue_size)
+    post_queue = queue.Queue(maxsize=queue_size)
+    stop       = threading.Event()
+    errors     = []
+
+    # page number -> [oldest epoch, before epoch, batches left, complete]
+    pages      = {}
+    pages_lock = threading.Lock()
+
+    def put(q, item):
+        # do not block forever if the writer stopped consuming
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def get(q):
+        while not stop.is_set():
+            try:
+                return q.get(timeout=0.5)
+            except queue.Empty:
+                continue
+        return None
+
+    def discover():
+        try:
+            pages_iterator = _discovery_pages(papi, subreddit_name, epochrange, shards, progress=progress)
+            for page, (ps_posts, oldest_epoch, before) in enumerate(pages_iterator):
+                ids = [f"t3_{post.id}" for post in ps_posts]
+                id_subsets = _chunks(ids, n)
+                with pages_lock:
+                    pages[page] = [oldest_epoch, before, max(1, len(id_subsets)), True]
+                if len(id_subsets) == 0:
+                    # nothing to load, the writer only records the interval
+                    if not put(post_queue, (page, [])):
+                        return
+                for subset in id_subsets:
+                    if not put(id_queue, (page, subset)):
+                        return
+        except Exception as e:
+            errors.append(e)
+        finally:
+            for _ in range(max_inflight):
+                put(id_queue, None)
+
+    def hydrate():
+        try:
+            while not stop.is_set():
+                item = get(id_queue)
+                if item is None:
+                    break
+                page, subset = item
                 posts = send_request(
                     lambda: rapi.info(subreddit_name, subset),
                     retries=5, progress=progress
                 )
-                if progress:
-                    print(f".{i+1}", end="", flush=True)
+                # failed requests are passed on as None, so that the page is not marked as loaded
+                put(post_queue, (page, posts))
+        except Exception as e:
+            errors.append(e)
+        finally:
+            put(post_queue, None)
+
+    threads = [threading.Thread(target=discover, daemon=True)]
+    threads += [threading.Thread(target=hydrate, daemon=True) for _ in range(max_inflight)]
+    for thread in threads:
+        thread.start()
+
+    finished, count, oldest_epoch = 0, 0, None
+    try:
+        while finished < max_inflight:
+            item = post_queue.get()
+            if item is None:
+                finished += 1
+                continue
+
+            page, posts = item
+            with pages_lock:
+                page_state = pages[page]
+                page_state[2] -= 1
+                page_state[3] = page_state[3] and posts is not None
+
+            if posts is not None and len(posts) > 0:
+                datacontext.add_posts(posts)
+                count += len(posts)
+                page_oldest = min([post.created_utc for post in posts])
+                oldest_epoch = page_oldest if oldest_epoch is None else min(oldest_epoch, page_oldest)
 
-                if posts is None:
-                    continue
+            if page_state[2] == 0 and page_state[3]:
+                datacontext.add_crawl_interval(subreddit_name, page_state[0], page_state[1])
 
-                datacontext.add_posts(posts)
+            if datacontext.transaction_size is None:
+                datacontext.commit()
 
-                oldest_epoch = min([post.created_utc for post in posts])
+            if progress and oldest_epoch is not None:
+                print(f"> stored {count} posts, oldest: {datetime.fromtimestamp(oldest_epoch)}", flush=True)
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
 
-            datacontext.commit()
-            if progress:
-                print(f", oldest: {datetime.fromtimestamp(oldest_epoch)}")
+    if len(errors) > 0:
+        raise errors[0]
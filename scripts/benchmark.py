@@ -0,0 +1,143 @@
+"""
+Benchmarks of the crawler, the database and the plotters against a local fake API server.
+
+    python benchmark.py --sizes 10000 100000 --output results.json
+
+Stages:
+    crawl          - load_posts against scripts/fake_server.py (capped by --crawl-size)
+    add_posts      - DataContext.add_posts with synthetic posts
+    select_posts   - DataContext.select_posts
+    select_columns - DataContext.select_columns
+    plot_frequency - plot_submission_frequency_histogram_2020
+    plot_time      - plot_submission_time_histogram
+"""
+import sys, os
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+import json
+import time
+import tempfile
+import argparse
+from datetime import datetime
+
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+
+from modules import PushshiftAPI, RedditAPI, DataContext, RateLimiter
+from modules import load_posts, plot_submission_frequency_histogram_2020, plot_submission_time_histogram
+from fake_server import FakeServer, synthetic_records
+
+
+SUBREDDIT = "benchmark"
+START = datetime(2020, 1, 1).timestamp()
+
+
+class Timer(object):
+    """
+    Context manager measuring wall time of a stage.
+
+    results, dict: stage name -> seconds is written here
+
+    name, str: stage name
+    """
+    def __init__(self, results, name):
+        self.results = results
+        self.name = name
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.results[self.name] = time.perf_counter() - self._start
+
+
+def benchmark_crawl(size, directory, latency=0, pipeline=True, shards=None):
+    """
+    Crawls `size` posts from the fake server into a new database.
+
+    Returns: dict of stage timings
+    """
+    results = {}
+    # posts are 60 seconds apart, cover them all
+    epochrange = [START + size * 60, START]
+    ratelimiter = RateLimiter(rate=10000, burst=100)
+
+    with FakeServer(posts_per_subreddit=size, latency=latency, start=START) as server:
+        papi = PushshiftAPI(ratelimiter=ratelimiter, api_url=server.url)
+        rapi = RedditAPI("id", "secret", ratelimiter=ratelimiter, api_url=server.url, auth_url=server.url)
+
+        with DataContext(os.path.join(directory, "crawl.db"), profile="performance") as context:
+            with Timer(results, "crawl"):
+                load_posts(SUBREDDIT, epochrange, papi, rapi, progress=False, pipeline=pipeline, datacontext=context,
+                    shards=shards)
+
+        results["requests"] = server.requests
+        papi.close()
+        rapi.close()
+
+    return results
+
+
+def benchmark_database(size, directory):
+    """
+    Writes and reads `size` synthetic posts.
+
+    Returns: dict of stage timings
+    """
+    results = {}
+    posts = synthetic_records(SUBREDDIT, size, start=START)
+
+    with DataContext(os.path.join(directory, f"database_{size}.db"), profile="performance") as context:
+        with Timer(results, "add_posts"):
+            context.add_posts(posts)
+            context.commit()
+
+        with Timer(results, "select_posts"):
+            selected = context.select_posts(subreddit_name=SUBREDDIT, include_removed=False)
+
+        with Timer(results, "select_columns"):
+            columns = context.select_columns(("created_utc", "created", "ups", "num_comments"),
+                subreddit_name=SUBREDDIT, include_removed=False)
+
+    with Timer(results, "plot_frequency"):
+        f, ax = plot_submission_frequency_histogram_2020(f"r/{SUBREDDIT}", columns, upvote_limits=[0, 50])
+        plt.close(f)
+
+    with Timer(results, "plot_time"):
+        f, ax = plot_submission_time_histogram(f"r/{SUBREDDIT}", columns, metric="success", success_score=100)
+        plt.close(f)
+
+    results["selected"] = len(selected)
+    return results
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Benchmark the crawler, the database and the plotters.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000], help="numbers of posts")
+    parser.add_argument("--crawl-size", type=int, default=10000, help="largest number of posts to crawl from the fake server")
+    parser.add_argument("--latency", type=float, default=0, help="fake server response delay, seconds")
+    parser.add_argument("--serial", action="store_true", help="crawl without the pipeline")
+    parser.add_argument("--shards", type=int, default=None, help="concurrent Pushshift requests (time window discovery)")
+    parser.add_argument("--output", default=None, help="JSON file to write the results to")
+    args = parser.parse_args()
+
+    report = []
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as directory:
+            results = { "size": size }
+            if size <= args.crawl_size:
+                results.update(benchmark_crawl(size, directory, latency=args.latency, pipeline=not args.serial,
+                    shards=args.shards))
+            results.update(benchmark_database(size, directory))
+
+        report.append(results)
+        timings = ", ".join([f"{key}={value:.3f}s" for key, value in results.items() if isinstance(value, float)])
+        print(f"> {size} posts: {timings}")
+
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=4)
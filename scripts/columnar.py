@@ -0,0 +1,25 @@
+import sys, os
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+import argparse
+
+from modules import DataContext
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Export posts to columnar files (one per subreddit and month) or import them.")
+    parser.add_argument("command", choices=["export", "import"])
+    parser.add_argument("directory", help="export directory (or a single file to import)")
+    parser.add_argument("--subreddit", default=None, help="export only this subreddit")
+    parser.add_argument("--format", default=None, choices=["parquet", "npz"], help="default: parquet if pyarrow is installed")
+    parser.add_argument("--database", default=None, help="path to the database, default: config.db_path")
+    args = parser.parse_args()
+
+    with DataContext(args.database, profile="performance") as context:
+        if args.command == "export":
+            paths = context.export_columnar(args.directory, subreddit_name=args.subreddit, format=args.format)
+            print(f"> Wrote {len(paths)} files to {args.directory}.")
+        else:
+            counts = context.import_columnar(args.directory)
+            print(f"> Imported posts: {counts['inserted']} new, {counts['updated']} updated, {counts['unchanged']} unchanged.")
@@ -0,0 +1,275 @@
+"""
+Local stand-in for Reddit and Pushshift APIs, serving synthetic posts.
+
+    with FakeServer(posts_per_subreddit=10000) as server:
+        rapi = RedditAPI("id", "secret", api_url=server.url, auth_url=server.url)
+        papi = PushshiftAPI(api_url=server.url)
+
+Endpoints:
+    POST /api/v1/access_token
+    GET  /r/{subreddit}/new
+    GET  /r/{subreddit}/search
+    GET  /r/{subreddit}/api/info, /api/info
+    GET  /reddit/search/submission/
+"""
+import sys, os
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+import json
+import time
+import threading
+from datetime import datetime
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from modules.containers import PostRecord, PostBatch, _id_to_int, _int_to_id
+
+# post IDs of different subreddits do not overlap
+SUBREDDIT_ID_OFFSET = 36**6
+
+
+def subreddit_number(subreddit):
+    return sum([ord(c) for c in subreddit.lower()]) % 1000
+
+
+def synthetic_post(subreddit, index, start=datetime(2020, 1, 1).timestamp(), spacing=60):
+    """
+    Deterministic synthetic post in Reddit API format.
+
+    subreddit, str: subreddit name,
+
+    index, int: post number in the subreddit, posts are `spacing` seconds apart from `start`
+    """
+    created_utc = int(start + index * spacing)
+    ups = (index * 7919) % 1500
+
+    return {
+        "id"             : _int_to_id(SUBREDDIT_ID_OFFSET * (subreddit_number(subreddit) + 1) + index),
+        "subreddit"      : subreddit,
+        "author"         : f"user{index % 977}",
+        "author_premium" : index % 13 == 0,
+        "subreddit_subscribers" : 100000,
+        "title"          : f"Synthetic post {index} in r/{subreddit}",
+        "downs"          : 0,
+        "ups"            : ups,
+        "selftext"       : "[removed]" if index % 31 == 0 else "Lorem ipsum dolor sit amet. " * (index % 5),
+        "num_comments"   : ups // 10,
+        "total_awards_received" : index % 3,
+        "all_awardings"  : [],
+        "view_count"     : None,
+        "permalink"      : f"/r/{subreddit}/comments/{index}/",
+        "url"            : f"https://www.reddit.com/r/{subreddit}/comments/{index}/",
+        "created"        : created_utc - 8 * 3600,
+        "created_utc"    : created_utc,
+    }
+
+
+def synthetic_records(subreddit, n, **kwargs):
+    """
+    Returns: list of n synthetic PostRecord objects
+    """
+    return [PostRecord.from_json(synthetic_post(subreddit, i, **kwargs)) for i in range(n)]
+
+
+def synthetic_batch(subreddit, n, **kwargs):
+    """
+    Returns: PostBatch of n synthetic posts
+    """
+    return PostBatch.from_posts(synthetic_records(subreddit, n, **kwargs))
+
+
+class FakeServer(object):
+    """
+    Threaded HTTP server emulating the APIs.
+
+    posts_per_subreddit, int: number of posts in every subreddit
+
+    latency, float: delay before every response in seconds
+
+    rate_limit, int: number of requests allowed per rate_window (None - unlimited), 429 is returned above it
+
+    rate_window, float: rate limit window in seconds
+
+    start, float: unix time of the first post
+
+    spacing, int: seconds between posts
+    """
+    def __init__(self, posts_per_subreddit=10000, latency=0, rate_limit=None, rate_window=600,
+            start=datetime(2020, 1, 1).timestamp(), spacing=60, port=0):
+        self.posts_per_subreddit = posts_per_subreddit
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.rate_window = rate_window
+        self.start = start
+        self.spacing = spacing
+        self.requests = 0
+
+        self._lock = threading.Lock()
+        self._window_start = time.monotonic()
+        self._window_requests = 0
+        self._subreddits = {}
+
+        server = self
+        class Handler(_Handler):
+            fake = server
+
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address
+        return f"http://{host}:{port}"
+
+
+    def __enter__(self):
+        self.start_server()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop_server()
+
+
+    def start_server(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+
+
+    def stop_server(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+    def post(self, subreddit, index):
+        self._subreddits[subreddit_number(subreddit)] = subreddit
+        return synthetic_post(subreddit, index, start=self.start, spacing=self.spacing)
+
+
+    def index(self, post_id):
+        """
+        Returns: subreddit-independent post number of a post ID
+        """
+        return _id_to_int(post_id) % SUBREDDIT_ID_OFFSET
+
+
+    def subreddit(self, post_id):
+        """
+        Returns: name of the subreddit a post ID was served for, None if unknown
+        """
+        return self._subreddits.get(_id_to_int(post_id) // SUBREDDIT_ID_OFFSET - 1)
+
+
+    def _rate_limit(self):
+        """
+        Returns: rate limit headers and whether the request is allowed
+        """
+        with self._lock:
+            self.requests += 1
+            if self.rate_limit is None:
+                return {}, True
+
+            now = time.monotonic()
+            if now - self._window_start >= self.rate_window:
+                self._window_start, self._window_requests = now, 0
+            self._window_requests += 1
+
+            reset = self.rate_window - (now - self._window_start)
+            remaining = max(0, self.rate_limit - self._window_requests)
+            headers = {
+                "X-Ratelimit-Used"      : str(self._window_requests),
+                "X-Ratelimit-Remaining" : str(remaining),
+                "X-Ratelimit-Reset"     : str(int(reset)),
+            }
+            return headers, self._window_requests <= self.rate_limit
+
+
+class _Handler(BaseHTTPRequestHandler):
+    fake = None
+
+    def log_message(self, format, *args):
+        pass
+
+
+    def _send(self, status, body, headers={}):
+        content = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+
+    def _listing(self, posts, after=None):
+        return {
+            "kind": "Listing",
+            "data": {
+                "children" : [{ "kind": "t3", "data": post } for post in posts],
+                "before"   : None,
+                "after"    : after,
+            }
+        }
+
+
+    def _handle(self, method):
+        fake = self.fake
+        if fake.latency > 0:
+            time.sleep(fake.latency)
+
+        headers, allowed = fake._rate_limit()
+        if not allowed:
+            return self._send(429, { "error": 429, "message": "Too Many Requests" }, headers)
+
+        url = urlparse(self.path)
+        query = { key: values[0] for key, values in parse_qs(url.query).items() }
+        parts = [part for part in url.path.split("/") if part != ""]
+        n = fake.posts_per_subreddit
+
+        if method == "POST" and url.path == "/api/v1/access_token":
+            return self._send(200, { "access_token": "fake-token", "token_type": "bearer", "expires_in": 3600 }, headers)
+
+        if method == "GET" and url.path == "/reddit/search/submission/":
+            subreddit = query.get("subreddit", "test")
+            size = min(int(query.get("size", 25)), 500)
+            before = int(query["before"]) if "before" in query else fake.start + n * fake.spacing
+            after = int(query["after"]) if "after" in query else fake.start - 1
+            # newest first, as Pushshift does
+            first = min(n - 1, int((before - 1 - fake.start) // fake.spacing))
+            last = max(0, int((after - fake.start) // fake.spacing) + 1)
+            indices = range(first, max(last, first - size + 1) - 1, -1) if first >= last else []
+            return self._send(200, { "data": [fake.post(subreddit, i) for i in indices] }, headers)
+
+        if method == "GET" and len(parts) >= 2 and parts[-2:] == ["api", "info"]:
+            posts = []
+            for fullname in query.get("id", "").split(","):
+                if not fullname.startswith("t3_"):
+                    continue
+                post_id = fullname[3:]
+                index = fake.index(post_id)
+                subreddit = parts[1] if parts[0] == "r" else fake.subreddit(post_id)
+                if index < n and subreddit is not None:
+                    posts.append(fake.post(subreddit, index))
+            return self._send(200, self._listing(posts), headers)
+
+        if method == "GET" and len(parts) == 3 and parts[0] == "r" and parts[2] in ("new", "search"):
+            subreddit = parts[1]
+            limit = min(int(query.get("limit", 25)), 100)
+            first = n - 1
+            if "after" in query:
+                first = fake.index(query["after"][3:]) - 1
+            indices = list(range(first, max(-1, first - limit), -1))
+            posts = [fake.post(subreddit, i) for i in indices]
+            after = f"t3_{posts[-1]['id']}" if len(posts) > 0 else None
+            return self._send(200, self._listing(posts, after), headers)
+
+        return self._send(404, { "error": 404, "message": "Not Found" }, headers)
+
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
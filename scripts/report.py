@@ -0,0 +1,34 @@
+import sys, os
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+import argparse
+
+from modules import run_analysis
+from modules.analysis import HOURLY_METRICS
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Write hourly/daily aggregates and figures for many subreddits in parallel.")
+    parser.add_argument("subreddits", nargs="*", help="subreddit names")
+    parser.add_argument("--subreddits-file", default=None, help="file with one subreddit name per line")
+    parser.add_argument("--metrics", nargs="+", default=list(HOURLY_METRICS), choices=HOURLY_METRICS)
+    parser.add_argument("--database", default=None, help="path to the database, default: config.db_path")
+    parser.add_argument("--output", default="../data/report", help="output directory")
+    parser.add_argument("--processes", type=int, default=None, help="number of worker processes, default: number of CPUs")
+    parser.add_argument("--no-figures", action="store_true", help="only write the CSV tables")
+    parser.add_argument("--utc", action="store_true", help="hours of day in UTC instead of local time")
+    args = parser.parse_args()
+
+    subreddits = list(args.subreddits)
+    if args.subreddits_file is not None:
+        with open(args.subreddits_file) as f:
+            subreddits += [line.strip() for line in f if line.strip() != ""]
+
+    results = run_analysis(subreddits, metrics=args.metrics, path=args.database, output_dir=args.output,
+        processes=args.processes, figures=not args.no_figures, utc=args.utc)
+
+    failed = [result for result in results if result["error"] is not None]
+    for result in failed:
+        print(f"\n> r/{result['subreddit']} failed:\n{result['error']}")
+    print(f"> {len(results) - len(failed)}/{len(results)} subreddits done.")